@@ -1,138 +1,33 @@
 from flask import Flask, render_template, request
+import os
 import secrets
 from datetime import datetime
 
-from database import init_database, get_db
+from counters import start_counter_folder
+from database import init_database, register_db_teardown, start_checkpointer
+from feed import load_first_page, load_poll_tally
+from idempotency import register_idempotency, start_idempotency_pruner
+from mutations import start_write_batcher
+from notifications import start_notification_dispatcher
 from routes import register_routes
+from search import load_suggest_index, start_suggest_rebuilder
+from templating import configure_templates
+from thumbnails import start_media_pipeline
+from words import load_word_cache, resolve_word, word_cache
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
-
-
-def get_all_words():
-    conn = get_db()
-    if not conn:
-        return []
-    
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, word, phonetic, description, challenge, date 
-            FROM word_of_day 
-            ORDER BY date DESC
-        """)
-        results = cursor.fetchall()
-        return [{
-            'id': row[0],
-            'word': row[1],
-            'phonetic': row[2],
-            'description': row[3],
-            'challenge': row[4],
-            'date': row[5]
-        } for row in results]
-    except Exception as e:
-        print(f"Error getting words: {e}")
-        return []
-    finally:
-        conn.close()
-
-
-def get_word_by_id(word_id):
-    conn = get_db()
-    if not conn:
-        return None
-    
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, word, phonetic, description, challenge, date 
-            FROM word_of_day 
-            WHERE id = ?
-        """, (word_id,))
-        result = cursor.fetchone()
-        
-        if result:
-            return {
-                'id': result[0],
-                'word': result[1],
-                'phonetic': result[2],
-                'description': result[3],
-                'challenge': result[4],
-                'date': result[5]
-            }
-        return None
-    except Exception as e:
-        print(f"Error getting word: {e}")
-        return None
-    finally:
-        conn.close()
-
-
-def get_latest_word():
-    conn = get_db()
-    if not conn:
-        return {
-            'id': 1,
-            'word': 'Ang Mo',
-            'phonetic': '[ ahng moh ]',
-            'description': 'A colloquial Hokkien term used in Singapore.',
-            'challenge': 'Share your thoughts about this word!',
-            'date': '2025-01-28'
-        }
-    
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, word, phonetic, description, challenge, date 
-            FROM word_of_day 
-            ORDER BY date DESC 
-            LIMIT 1
-        """)
-        result = cursor.fetchone()
-        
-        if result:
-            return {
-                'id': result[0],
-                'word': result[1],
-                'phonetic': result[2],
-                'description': result[3],
-                'challenge': result[4],
-                'date': result[5]
-            }
-        else:
-            return {
-                'id': 1,
-                'word': 'Ang Mo',
-                'phonetic': '[ ahng moh ]',
-                'description': 'A colloquial Hokkien term used in Singapore.',
-                'challenge': 'Share your thoughts about this word!',
-                'date': '2025-01-28'
-            }
-    except Exception as e:
-        print(f"Error getting word of day: {e}")
-        return {
-            'id': 1,
-            'word': 'Ang Mo',
-            'phonetic': '[ ahng moh ]',
-            'description': 'A colloquial Hokkien term used in Singapore.',
-            'challenge': 'Share your thoughts about this word!',
-            'date': '2025-01-28'
-        }
-    finally:
-        conn.close()
+# Media is uploaded through /api/media, which sets its own limit, so JSON
+# bodies are small and anything larger is refused before it is buffered.
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('BRIDGEGEN_MAX_REQUEST_BYTES', 1024 * 1024))
+configure_templates(app)
 
 
 @app.route('/')
 @app.route('/youth/feed')
 def youth_feed():
-    word_id = request.args.get('word_id', type=int)
-    
-    if word_id:
-        word_of_day = get_word_by_id(word_id)
-        if not word_of_day:
-            word_of_day = get_latest_word()
-    else:
-        word_of_day = get_latest_word()
+    word_of_day = resolve_word(request.args.get('word_id', type=int))
+    word_list_version, all_words = word_cache.snapshot()
     
     current_user = {
         'id': 'user-matt',
@@ -146,21 +41,17 @@ def youth_feed():
         version='youth',
         current_user=current_user,
         word_of_day=word_of_day,
-        all_words=get_all_words(),
+        all_words=all_words,
+        word_list_version=word_list_version,
+        initial_feed=load_first_page(current_user['id'], word_of_day['id']),
         today=datetime.now().strftime('%A, %B %d, %Y')
     )
 
 
 @app.route('/elderly/feed')
 def elderly_feed():
-    word_id = request.args.get('word_id', type=int)
-    
-    if word_id:
-        word_of_day = get_word_by_id(word_id)
-        if not word_of_day:
-            word_of_day = get_latest_word()
-    else:
-        word_of_day = get_latest_word()
+    word_of_day = resolve_word(request.args.get('word_id', type=int))
+    word_list_version, all_words = word_cache.snapshot()
     
     current_user = {
         'id': 'user-matt-senior',
@@ -174,13 +65,27 @@ def elderly_feed():
         version='elderly',
         current_user=current_user,
         word_of_day=word_of_day,
-        all_words=get_all_words(),
+        all_words=all_words,
+        word_list_version=word_list_version,
+        initial_feed=load_first_page(current_user['id'], word_of_day['id']),
         today=datetime.now().strftime('%A, %B %d, %Y')
     )
 
+register_idempotency(app)
 register_routes(app)
+register_db_teardown(app)
 
 init_database()
+start_media_pipeline()
+start_checkpointer()
+start_notification_dispatcher()
+start_write_batcher()
+start_idempotency_pruner()
+start_counter_folder()
+load_suggest_index()
+start_suggest_rebuilder()
+load_poll_tally()
+load_word_cache()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
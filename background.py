@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class PeriodicTask:
+    # Runs func every `interval` seconds on a daemon thread. Used for the
+    # housekeeping jobs that must stay off the request path.
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.errors = 0
+        self.last_duration = None
+        self.last_result = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        start = time.monotonic()
+        try:
+            self.last_result = self.func()
+        except Exception as e:
+            self.errors += 1
+            print(f"Error in {self.name}: {e}")
+        finally:
+            self.runs += 1
+            self.last_duration = time.monotonic() - start
+        return self.last_result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stats(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'interval': self.interval,
+            'runs': self.runs,
+            'errors': self.errors,
+            'lastDurationMs': round(self.last_duration * 1000, 3) if self.last_duration is not None else None,
+            'lastResult': self.last_result
+        }
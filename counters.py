@@ -0,0 +1,79 @@
+import os
+import sqlite3
+
+from background import PeriodicTask
+from database import get_db
+
+FOLD_INTERVAL = float(os.environ.get('BRIDGEGEN_COUNTER_FOLD_INTERVAL', 5))
+
+# Hot counters are not updated in place. Each like or vote appends a +1/-1
+# row to the narrow counter_deltas table, and a background task folds the
+# accumulated deltas into the base column in one transaction. Readers add
+# the pending sum, so a count is exact the moment its delta commits.
+COUNTERS = {
+    'post_likes': ('posts', 'likes_count'),
+    'poll_votes': ('poll_options', 'votes_count')
+}
+
+
+def pending_delta_sql(kind, id_expr):
+    return f"""COALESCE(
+        (SELECT SUM(delta) FROM counter_deltas WHERE kind = '{kind}' AND target_id = {id_expr}), 0
+    )"""
+
+
+def add_delta(conn, kind, target_id, delta):
+    # Returns the delta's id; ids only grow, since the table is AUTOINCREMENT.
+    return conn.execute(
+        "INSERT INTO counter_deltas (kind, target_id, delta) VALUES (?, ?, ?)",
+        (kind, target_id, delta)
+    ).lastrowid
+
+
+def read_counter(conn, kind, target_id):
+    table, column = COUNTERS[kind]
+    row = conn.execute(
+        f"SELECT {column} + {pending_delta_sql(kind, '?')} FROM {table} WHERE id = ?",
+        (target_id, target_id)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def fold_counters():
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            max_id = conn.execute("SELECT MAX(id) FROM counter_deltas").fetchone()[0]
+            if max_id is None:
+                conn.rollback()
+                return {'deltas': 0, 'targets': 0}
+            targets = 0
+            for kind, (table, column) in COUNTERS.items():
+                targets += conn.execute(f"""
+                    UPDATE {table} SET {column} = {column} + pending.total
+                    FROM (
+                        SELECT target_id, SUM(delta) AS total FROM counter_deltas
+                        WHERE kind = ? AND id <= ?
+                        GROUP BY target_id
+                    ) pending
+                    WHERE {table}.id = pending.target_id AND pending.total != 0
+                """, (kind, max_id)).rowcount
+            deltas = conn.execute("DELETE FROM counter_deltas WHERE id <= ?", (max_id,)).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        return {'deltas': deltas, 'targets': targets}
+    finally:
+        conn.close()
+
+
+counter_folder = PeriodicTask('counter-folder', FOLD_INTERVAL, fold_counters)
+
+
+def start_counter_folder():
+    if FOLD_INTERVAL > 0:
+        counter_folder.start()
@@ -1,25 +1,655 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
+
+from flask import g, has_app_context
+
+from background import PeriodicTask
+from media import extract_inline_media
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'bridgegen.db')
 
+# journal_mode is stored in the database file and set by init_database; the
+# other pragmas are per connection and applied when the pool opens one.
+# "wal" lets readers run while a writer holds the lock, and only fsyncs at
+# checkpoints, which a background thread runs instead of the request that
+# happens to cross wal_autocheckpoint.
+DB_PROFILES = {
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'wal_autocheckpoint': 1000,
+        'checkpoint_interval': 0
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 128 * 1024 * 1024,
+        'wal_autocheckpoint': 10000,
+        'checkpoint_interval': 30
+    }
+}
+
+DB_PROFILE = DB_PROFILES[os.environ.get('BRIDGEGEN_DB_PROFILE', 'wal')]
+
+POOL_SIZE = int(os.environ.get('BRIDGEGEN_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('BRIDGEGEN_DB_POOL_TIMEOUT', 10))
+STATEMENT_CACHE_SIZE = 256
+
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing it, so
+    # existing "finally: conn.close()" blocks keep working unchanged.
+    pool = None
+    checked_out = False
+    lease = 0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._acquisitions = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._leases = 0
+
+    def _connect(self):
+        conn = open_connection(self.path, factory=PooledConnection)
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        start = time.monotonic()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._acquisitions += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._leases += 1
+            conn.lease = self._leases
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as err:
+            print(f"Discarding broken connection: {err}")
+            conn.discard()
+            with self._lock:
+                self._in_use -= 1
+                self._created -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'inUse': self._in_use,
+                'peakInUse': self._peak_in_use,
+                'utilization': round(self._in_use / self.size, 4),
+                'acquisitions': self._acquisitions,
+                'avgWaitMs': round(self._wait_total / self._acquisitions * 1000, 3) if self._acquisitions else 0,
+                'maxWaitMs': round(self._wait_max * 1000, 3),
+                'timeouts': self._timeouts
+            }
+
+
+def apply_connection_pragmas(conn, profile=None):
+    profile = profile or DB_PROFILE
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA wal_autocheckpoint = {int(profile['wal_autocheckpoint'])}")
+
+
+def open_connection(path=None, factory=sqlite3.Connection):
+    # Also used directly by long-lived background writers, which must not
+    # hold a pool slot that request handlers are waiting for.
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        factory=factory,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.row_factory = sqlite3.Row
+    apply_connection_pragmas(conn)
+    return conn
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Pools are per process: a gunicorn worker forked from a parent that
+    # already opened connections must not share them.
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool.path != DB_PATH:
+            _pool = ConnectionPool(DB_PATH)
+            _pool_pid = os.getpid()
+        return _pool
+
 
 def get_db():
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
-    except sqlite3.Error as err:
-        print(f"Database connection error: {err}")
+        conn = get_pool().acquire()
+    except (sqlite3.Error, queue.Empty) as err:
+        print(f"Database connection error: {err or 'pool exhausted'}")
         return None
+    if has_app_context():
+        g.setdefault('db_connections', []).append((conn, conn.lease))
+    return conn
+
+
+def release_request_connections(exc=None):
+    # Safety net for handlers that return without closing their connection.
+    # The lease check skips connections that were closed and have since been
+    # handed to another request.
+    for conn, lease in g.pop('db_connections', []):
+        if conn.checked_out and conn.lease == lease:
+            conn.close()
+
+
+def register_db_teardown(app):
+    app.teardown_appcontext(release_request_connections)
+
+
+def checkpoint(mode='PASSIVE'):
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return {'busy': bool(busy), 'logFrames': log_frames, 'checkpointed': checkpointed}
+    finally:
+        conn.close()
+
+
+checkpointer = PeriodicTask('wal-checkpointer', DB_PROFILE['checkpoint_interval'], checkpoint)
+
+
+def start_checkpointer():
+    if DB_PROFILE['journal_mode'] == 'WAL' and DB_PROFILE['checkpoint_interval'] > 0:
+        checkpointer.start()
+
+
+# Ordered schema changes applied on top of the base tables created in
+# init_database. Each entry runs once, in its own transaction, and is recorded
+# in schema_version; append new steps here instead of editing the CREATE
+# TABLE statements so existing databases pick them up without a rebuild.
+MIGRATIONS = [
+    (1, 'secondary indexes for feed and notification queries', [
+        """
+        CREATE INDEX IF NOT EXISTS idx_posts_word_rank
+        ON posts (word_id, likes_count DESC, created_at DESC, id DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_posts_rank
+        ON posts (likes_count DESC, created_at DESC, id DESC)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_post_media_post ON post_media (post_id)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_comments_post_rank
+        ON comments (post_id, likes_count DESC, created_at DESC)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_polls_post ON polls (post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_poll_options_poll ON poll_options (poll_id, votes_count DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_poll_votes_option ON poll_votes (option_id)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_time ON notifications (user_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_read ON notifications (user_id, read)",
+    ]),
+    (2, 'remove notifications for deleted posts', [
+        "CREATE INDEX IF NOT EXISTS idx_notifications_post ON notifications (post_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_posts_delete_notifications
+        AFTER DELETE ON posts
+        BEGIN
+            DELETE FROM notifications WHERE post_id = OLD.id;
+        END
+        """,
+        """
+        DELETE FROM notifications
+        WHERE post_id IS NOT NULL AND post_id NOT IN (SELECT id FROM posts)
+        """,
+    ]),
+    (3, 'group like and vote notifications per target', [
+        "ALTER TABLE notifications ADD COLUMN group_key TEXT",
+        "ALTER TABLE notifications ADD COLUMN actor_count INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE notifications ADD COLUMN recent_actors TEXT NOT NULL DEFAULT '[]'",
+        """
+        UPDATE notifications SET
+            group_key = CASE type
+                WHEN 'post_like' THEN 'post_like:' || post_id
+                WHEN 'comment_like' THEN 'comment_like:' || comment_id
+                WHEN 'poll_vote' THEN 'poll_vote:' || post_id
+            END,
+            recent_actors = json_array(actor_id)
+        """,
+        # Fold each group into its newest row, which becomes the aggregate.
+        """
+        UPDATE notifications SET
+            actor_count = (
+                SELECT COUNT(DISTINCT n.actor_id) FROM notifications n
+                WHERE n.user_id = notifications.user_id AND n.group_key = notifications.group_key
+            ),
+            read = (
+                SELECT MIN(n.read) FROM notifications n
+                WHERE n.user_id = notifications.user_id AND n.group_key = notifications.group_key
+            ),
+            recent_actors = (
+                SELECT json_group_array(actor_id) FROM (
+                    SELECT n.actor_id FROM notifications n
+                    WHERE n.user_id = notifications.user_id AND n.group_key = notifications.group_key
+                    GROUP BY n.actor_id
+                    ORDER BY MAX(n.id) DESC
+                    LIMIT 3
+                )
+            )
+        WHERE group_key IS NOT NULL AND id = (
+            SELECT MAX(n.id) FROM notifications n
+            WHERE n.user_id = notifications.user_id AND n.group_key = notifications.group_key
+        )
+        """,
+        """
+        DELETE FROM notifications
+        WHERE group_key IS NOT NULL AND id < (
+            SELECT MAX(n.id) FROM notifications n
+            WHERE n.user_id = notifications.user_id AND n.group_key = notifications.group_key
+        )
+        """,
+        # NULL keys never collide, so ungrouped types (comments) are unaffected.
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_group ON notifications (user_id, group_key)",
+    ]),
+    # Per-user notification state. seq orders each user's notifications and
+    # is reassigned whenever a grouped row is bumped; everything at or below
+    # read_watermark counts as read and everything at or below
+    # cleared_watermark is hidden, so "read all" and "clear all" touch one
+    # row. The triggers keep unread_count exact for every write path.
+    (4, 'notification counters and read watermarks', [
+        "ALTER TABLE notifications ADD COLUMN seq INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE notifications SET seq = ranked.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at, id) AS seq
+            FROM notifications
+        ) ranked
+        WHERE notifications.id = ranked.id
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_seq ON notifications (user_id, seq DESC)",
+        """
+        CREATE TABLE IF NOT EXISTS notification_state (
+            user_id TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0,
+            read_watermark INTEGER NOT NULL DEFAULT 0,
+            cleared_watermark INTEGER NOT NULL DEFAULT 0,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        INSERT INTO notification_state (user_id, last_seq, unread_count)
+        SELECT user_id, MAX(seq), SUM(read = 0)
+        FROM notifications
+        GROUP BY user_id
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_insert
+        AFTER INSERT ON notifications
+        BEGIN
+            INSERT INTO notification_state (user_id, last_seq, unread_count)
+            VALUES (NEW.user_id, NEW.seq, NEW.read = 0)
+            ON CONFLICT (user_id) DO UPDATE SET
+                last_seq = MAX(last_seq, excluded.last_seq),
+                unread_count = unread_count + (NEW.read = 0 AND NEW.seq > read_watermark);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_update
+        AFTER UPDATE OF read, seq ON notifications
+        BEGIN
+            UPDATE notification_state SET
+                last_seq = MAX(last_seq, NEW.seq),
+                unread_count = unread_count
+                    + (NEW.read = 0 AND NEW.seq > read_watermark)
+                    - (OLD.read = 0 AND OLD.seq > read_watermark)
+            WHERE user_id = NEW.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_delete
+        AFTER DELETE ON notifications
+        BEGIN
+            UPDATE notification_state SET
+                unread_count = unread_count - (OLD.read = 0 AND OLD.seq > read_watermark)
+            WHERE user_id = OLD.user_id;
+        END
+        """,
+    ]),
+    (5, 'notification retention index', [
+        "CREATE INDEX IF NOT EXISTS idx_notifications_created ON notifications (created_at)",
+    ]),
+    (6, 'delta table for hot counters', [
+        """
+        CREATE TABLE IF NOT EXISTS counter_deltas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            target_id TEXT NOT NULL,
+            delta INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_counter_deltas_target ON counter_deltas (kind, target_id, delta)",
+    ]),
+    (7, 'idempotency keys for batched interactions', [
+        """
+        CREATE TABLE IF NOT EXISTS interaction_keys (
+            user_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_interaction_keys_created ON interaction_keys (created_at)",
+    ]),
+    (8, 'move inline data URL media to content-addressed files', [
+        extract_inline_media,
+    ]),
+    # Resized renders of stored media, keyed by the source /media/ URL so
+    # post_media rows can be replaced (as update_post does) without losing
+    # or re-rendering them. kind is 'image' for width variants and 'poster'
+    # for video poster frames.
+    (9, 'resized image variants and video posters', [
+        """
+        CREATE TABLE IF NOT EXISTS media_variants (
+            source_url TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('image', 'poster')),
+            width INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (source_url, kind, width, format)
+        )
+        """,
+    ]),
+    # Responses to requests sent with an Idempotency-Key header, shared by
+    # every worker. status is NULL while the first request is in flight;
+    # updated_at is a unix timestamp, set when the key is claimed and again
+    # when the response is stored.
+    (10, 'shared idempotency keys for HTTP requests', [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status INTEGER,
+            headers TEXT,
+            body BLOB,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (scope, key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_updated ON idempotency_keys (updated_at)",
+    ]),
+    # A short log of notification changes that every worker tails to feed
+    # its own SSE streams. notification_id is set when a row was created or
+    # bumped to the top and NULL when only the user's unread count or
+    # cleared watermark moved. Ids are AUTOINCREMENT so a tail's watermark
+    # never skips a reused id.
+    (11, 'notification event log for streams', [
+        """
+        CREATE TABLE IF NOT EXISTS notification_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            notification_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_notification_events_created ON notification_events (created_at)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_event_insert
+        AFTER INSERT ON notifications
+        BEGIN
+            INSERT INTO notification_events (user_id, notification_id) VALUES (NEW.user_id, NEW.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_event_update
+        AFTER UPDATE OF seq ON notifications
+        WHEN NEW.seq != OLD.seq
+        BEGIN
+            INSERT INTO notification_events (user_id, notification_id) VALUES (NEW.user_id, NEW.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_notification_state_event
+        AFTER UPDATE OF unread_count, cleared_watermark ON notification_state
+        WHEN NEW.unread_count != OLD.unread_count OR NEW.cleared_watermark != OLD.cleared_watermark
+        BEGIN
+            INSERT INTO notification_events (user_id, notification_id) VALUES (NEW.user_id, NULL);
+        END
+        """,
+    ]),
+]
+
+
+def get_schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    for version, name, steps in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock before the version is checked,
+        # so workers starting at the same time apply each step exactly once.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+            print(f"Applied migration {version}: {name}")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+
+# Full-text index over each post's own text, its comments and its word of the
+# day. Rows share the post's rowid so the sync triggers below can address
+# them directly. It is set up outside MIGRATIONS because it depends on the
+# SQLite build: without FTS5, search falls back to LIKE and setup is simply
+# retried on the next start.
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        post_text, comment_text, word_text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_insert AFTER INSERT ON posts
+    BEGIN
+        INSERT INTO posts_fts (rowid, post_text, comment_text, word_text)
+        VALUES (
+            NEW.rowid,
+            COALESCE(NEW.text, ''),
+            '',
+            COALESCE((SELECT word || ' ' || COALESCE(description, '') FROM word_of_day WHERE id = NEW.word_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_update AFTER UPDATE OF text, word_id ON posts
+    BEGIN
+        UPDATE posts_fts SET
+            post_text = COALESCE(NEW.text, ''),
+            word_text = COALESCE((SELECT word || ' ' || COALESCE(description, '') FROM word_of_day WHERE id = NEW.word_id), '')
+        WHERE rowid = NEW.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_delete AFTER DELETE ON posts
+    BEGIN
+        DELETE FROM posts_fts WHERE rowid = OLD.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_comments_fts_insert AFTER INSERT ON comments
+    BEGIN
+        UPDATE posts_fts
+        SET comment_text = COALESCE((SELECT group_concat(text, ' ') FROM comments WHERE post_id = NEW.post_id), '')
+        WHERE rowid = (SELECT rowid FROM posts WHERE id = NEW.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_comments_fts_update AFTER UPDATE OF text ON comments
+    BEGIN
+        UPDATE posts_fts
+        SET comment_text = COALESCE((SELECT group_concat(text, ' ') FROM comments WHERE post_id = NEW.post_id), '')
+        WHERE rowid = (SELECT rowid FROM posts WHERE id = NEW.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_comments_fts_delete AFTER DELETE ON comments
+    BEGIN
+        UPDATE posts_fts
+        SET comment_text = COALESCE((SELECT group_concat(text, ' ') FROM comments WHERE post_id = OLD.post_id), '')
+        WHERE rowid = (SELECT rowid FROM posts WHERE id = OLD.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_word_of_day_fts_update AFTER UPDATE OF word, description ON word_of_day
+    BEGIN
+        UPDATE posts_fts
+        SET word_text = NEW.word || ' ' || COALESCE(NEW.description, '')
+        WHERE rowid IN (SELECT rowid FROM posts WHERE word_id = NEW.id);
+    END
+    """,
+]
+
+_search_index_available = False
+
+
+def search_index_available():
+    return _search_index_available
+
+
+def rebuild_search_index(conn):
+    conn.execute("DELETE FROM posts_fts")
+    conn.execute("""
+        INSERT INTO posts_fts (rowid, post_text, comment_text, word_text)
+        SELECT p.rowid,
+               COALESCE(p.text, ''),
+               COALESCE((SELECT group_concat(c.text, ' ') FROM comments c WHERE c.post_id = p.id), ''),
+               COALESCE(w.word || ' ' || COALESCE(w.description, ''), '')
+        FROM posts p
+        LEFT JOIN word_of_day w ON w.id = p.word_id
+    """)
+
+
+def init_search_index(conn):
+    global _search_index_available
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone()
+        for statement in SEARCH_INDEX_DDL:
+            conn.execute(statement)
+        if not exists:
+            rebuild_search_index(conn)
+        conn.commit()
+        _search_index_available = True
+    except sqlite3.OperationalError as err:
+        conn.rollback()
+        _search_index_available = False
+        print(f"Full-text search unavailable, using LIKE search: {err}")
 
 
 def init_database():
     conn = None
     try:
         conn = sqlite3.connect(DB_PATH)
-        conn.execute("PRAGMA foreign_keys = ON")
+        # Only takes effect on a new, empty database; an existing file keeps
+        # its mode until a full VACUUM is run on it.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute(f"PRAGMA journal_mode = {DB_PROFILE['journal_mode']}")
+        apply_connection_pragmas(conn)
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -155,25 +785,9 @@ def init_database():
             )
         """)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                type TEXT NOT NULL,
-                actor_id TEXT NOT NULL,
-                actor_name TEXT NOT NULL,
-                post_id TEXT,
-                comment_id TEXT,
-                message TEXT NOT NULL,
-                is_read INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (actor_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
-            )
-        """)
-        
         conn.commit()
+        run_migrations(conn)
+        init_search_index(conn)
         insert_sample_data(cursor, conn)
         
     except sqlite3.Error as err:
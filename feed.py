@@ -0,0 +1,558 @@
+import base64
+import binascii
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from counters import pending_delta_sql
+from database import get_db
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+POLL_TALLY_WARM_DAYS = 30
+
+
+# likes includes deltas not yet folded into likes_count; rank_likes is the
+# stored column the feed is ordered and paged by.
+POST_COLUMNS = f"""
+    p.id, p.user_id as userId, p.text,
+    p.likes_count + {pending_delta_sql('post_likes', 'p.id')} as likes,
+    p.likes_count as rank_likes,
+    p.created_at, p.word_id,
+    u.name as author, u.initials, u.age, u.type
+"""
+
+
+def dict_from_row(row):
+    if row is None:
+        return None
+    return dict(zip(row.keys(), row))
+
+
+def format_time_ago(created_at):
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+        except:
+            return created_at
+
+    now = datetime.now()
+    diff = now - created_at
+
+    seconds = diff.total_seconds()
+    if seconds < 60:
+        return 'Just now'
+    elif seconds < 3600:
+        mins = int(seconds / 60)
+        return f'{mins}m ago'
+    elif seconds < 86400:
+        hours = int(seconds / 3600)
+        return f'{hours}h ago'
+    else:
+        days = int(seconds / 86400)
+        return f'{days}d ago'
+
+
+# Sort key layout of the feed cursor: (likes_count, created_at, id).
+FEED_CURSOR_TYPES = (int, str, str)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key_types=FEED_CURSOR_TYPES):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != len(key_types):
+        raise ValueError('Invalid cursor')
+    if not all(isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(key, key_types)):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+def parse_page_args(args, key_types=FEED_CURSOR_TYPES):
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    token = args.get('cursor')
+    after = decode_cursor(token, key_types) if token else None
+    return after, limit
+
+
+def fetch_post_page(cursor, word_id=None, after=None, limit=DEFAULT_PAGE_SIZE, search_pattern=None):
+    # Keyset pagination over (likes_count, created_at, id), with the id only
+    # there to break ties. The cursor carries the sort key of the last post
+    # sent, so pages never shift when other posts gain or lose likes.
+    conditions = []
+    params = []
+    if word_id:
+        conditions.append("p.word_id = ?")
+        params.append(word_id)
+    if search_pattern:
+        conditions.append("p.text LIKE ?")
+        params.append(search_pattern)
+    if after:
+        conditions.append("(p.likes_count, p.created_at, p.id) < (?, ?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor.execute(f"""
+        SELECT {POST_COLUMNS}
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        {where}
+        ORDER BY p.likes_count DESC, p.created_at DESC, p.id DESC
+        LIMIT ?
+    """, (*params, limit + 1))
+    posts = [dict_from_row(row) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        last = posts[-1]
+        next_cursor = encode_cursor((last['rank_likes'], last['created_at'], last['id']))
+    return posts, next_cursor
+
+
+def format_poll(poll_id, question, options, user_vote):
+    total_votes = sum(opt['votes_count'] for opt in options)
+    return {
+        'id': poll_id,
+        'question': question,
+        'options': [{
+            'id': opt['id'],
+            'text': opt['text'],
+            'votes': opt['votes_count'],
+            'percentage': round((opt['votes_count'] / total_votes * 100) if total_votes > 0 else 0)
+        } for opt in options],
+        'totalVotes': total_votes,
+        'userVote': user_vote
+    }
+
+
+class FeedCache:
+    # Caches the viewer-independent part of a feed page. Every write bumps the
+    # version, which retires all entries at once; the TTL bounds how long a
+    # worker can serve a page that another worker has since changed.
+
+    def __init__(self, max_entries=256, ttl=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self._version or time.monotonic() - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, value):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0,
+                'invalidations': self.invalidations
+            }
+
+
+feed_cache = FeedCache()
+
+
+class PollTally:
+    # Option counts for recently used polls, with totals and percentages
+    # already worked out, so feed pages and vote responses do not re-read
+    # poll_options. Each entry records the newest counter_deltas id its
+    # snapshot includes; a worker adds its own committed votes to the entry
+    # only when their delta ids are past that watermark, so a vote the
+    # snapshot already saw is not counted twice. Entries are reloaded after
+    # `ttl` seconds to pick up votes taken by other workers. The counts
+    # themselves are persisted through counter_deltas, which the counter
+    # folder flushes into poll_options in batches.
+
+    def __init__(self, max_entries=10000, ttl=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._polls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.votes = 0
+
+    @staticmethod
+    def _apply(options, moves):
+        # moves are (delta id, option id, +1/-1) tuples.
+        counts = {}
+        for _, option_id, delta in moves:
+            counts[option_id] = counts.get(option_id, 0) + delta
+        return [{**opt, 'votes_count': opt['votes_count'] + counts.get(opt['id'], 0)} for opt in options]
+
+    def _put(self, poll_id, options, watermark, loaded_at, applied):
+        options = sorted(options, key=lambda opt: opt['votes_count'], reverse=True)
+        self._polls[poll_id] = {
+            'watermark': watermark,
+            'loaded_at': loaded_at,
+            'options': options,
+            'applied': applied,
+            'summary': format_poll(poll_id, None, options, None)
+        }
+        self._polls.move_to_end(poll_id)
+        while len(self._polls) > self.max_entries:
+            self._polls.popitem(last=False)
+
+    def _store(self, poll_id, options, watermark, loaded_at):
+        # A snapshot older than the cached one never replaces it. Votes
+        # already applied in memory that the new snapshot does not include
+        # are carried over onto it.
+        entry = self._polls.get(poll_id)
+        applied = []
+        if entry is not None:
+            if entry['watermark'] > watermark:
+                return
+            applied = [move for move in entry['applied'] if move[0] > watermark]
+        self._put(poll_id, self._apply(options, applied), watermark, loaded_at, applied)
+
+    def load(self, cursor, poll_ids):
+        # The sequence, unlike MAX(id), does not go back when the counter
+        # folder deletes deltas; reading it in the same statement ties it to
+        # the same snapshot as the counts.
+        loaded_at = time.monotonic()
+        cursor.execute(f"""
+            SELECT o.id, o.poll_id, o.text, o.votes_count + {pending_delta_sql('poll_votes', 'o.id')} as votes_count,
+                   (SELECT seq FROM sqlite_sequence WHERE name = 'counter_deltas') as watermark
+            FROM poll_options o
+            WHERE o.poll_id IN (SELECT value FROM json_each(?))
+            ORDER BY o.rowid
+        """, (json.dumps(list(poll_ids)),))
+        options_by_poll = {poll_id: [] for poll_id in poll_ids}
+        watermark = 0
+        for row in cursor.fetchall():
+            watermark = row['watermark'] or 0
+            options_by_poll[row['poll_id']].append({
+                'id': row['id'], 'text': row['text'], 'votes_count': row['votes_count']
+            })
+        with self._lock:
+            for poll_id, options in options_by_poll.items():
+                self._store(poll_id, options, watermark, loaded_at)
+
+    def summaries(self, cursor, poll_ids):
+        # Returns {poll_id: format_poll(...)} with question and userVote left
+        # for the caller; every stale or missing poll is loaded in one query.
+        now = time.monotonic()
+        with self._lock:
+            found = {}
+            for poll_id in poll_ids:
+                entry = self._polls.get(poll_id)
+                if entry is not None and now - entry['loaded_at'] <= self.ttl:
+                    found[poll_id] = entry['summary']
+            self.hits += len(found)
+            self.misses += len(poll_ids) - len(found)
+        missing = [poll_id for poll_id in poll_ids if poll_id not in found]
+        if missing:
+            self.load(cursor, missing)
+            with self._lock:
+                for poll_id in missing:
+                    found[poll_id] = self._polls[poll_id]['summary']
+        return found
+
+    def has_option(self, poll_id, option_id):
+        # None when the poll is not in memory and the caller must check.
+        with self._lock:
+            entry = self._polls.get(poll_id)
+            if entry is None:
+                return None
+            return any(opt['id'] == option_id for opt in entry['options'])
+
+    def apply_vote(self, cursor, poll_id, moves):
+        # Called once a vote's moves have committed; returns the poll's
+        # summary. Only a poll that is not cached is read from the database,
+        # and that read already includes the vote.
+        with self._lock:
+            entry = self._polls.get(poll_id)
+            if entry is not None:
+                moves = [move for move in moves if move[0] > entry['watermark']]
+                if moves:
+                    self._put(poll_id, self._apply(entry['options'], moves), entry['watermark'],
+                              entry['loaded_at'], entry['applied'] + moves)
+                    self.votes += 1
+                return self._polls[poll_id]['summary']
+        return self.summaries(cursor, [poll_id])[poll_id]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'polls': len(self._polls),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0,
+                'votesApplied': self.votes
+            }
+
+
+poll_tally = PollTally()
+
+
+def load_poll_tally():
+    # Warms the tally with polls on recent posts so the first feed loads
+    # after a restart do not each pay for the option query.
+    conn = get_db()
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT pl.id FROM polls pl JOIN posts p ON pl.post_id = p.id
+            WHERE p.created_at >= datetime('now', ?)
+        """, (f'-{POLL_TALLY_WARM_DAYS} days',))
+        poll_ids = [row[0] for row in cursor.fetchall()]
+        if poll_ids:
+            poll_tally.load(cursor, poll_ids)
+    except sqlite3.Error as err:
+        print(f"Error loading poll tally: {err}")
+    finally:
+        conn.close()
+
+
+def load_feed_body(cursor, posts):
+    # Every related table is loaded for the whole page at once. The ids are
+    # bound as a single JSON array so the SQL text (and the number of
+    # statements) stays the same no matter how many posts are on the page.
+    if not posts:
+        return []
+
+    post_ids = json.dumps([post['id'] for post in posts])
+
+    media_by_post = {}
+    cursor.execute("""
+        SELECT post_id, media_type as type, url
+        FROM post_media
+        WHERE post_id IN (SELECT value FROM json_each(?))
+        ORDER BY id
+    """, (post_ids,))
+    for row in cursor.fetchall():
+        media_by_post.setdefault(row['post_id'], []).append(
+            {'type': row['type'], 'url': row['url'], 'variants': [], 'poster': None}
+        )
+
+    # Variants appear once the background render has finished; until then
+    # the client shows the original.
+    media_urls = {item['url']: item for items in media_by_post.values() for item in items}
+    if media_urls:
+        variants_by_url = {}
+        cursor.execute("""
+            SELECT source_url, kind, width, format, url
+            FROM media_variants
+            WHERE source_url IN (SELECT value FROM json_each(?))
+            ORDER BY source_url, width
+        """, (json.dumps(list(media_urls)),))
+        for row in cursor.fetchall():
+            variants_by_url.setdefault(row['source_url'], []).append(row)
+        for items in media_by_post.values():
+            for item in items:
+                for row in variants_by_url.get(item['url'], []):
+                    if row['kind'] == 'poster':
+                        item['poster'] = row['url']
+                    else:
+                        item['variants'].append({'width': row['width'], 'format': row['format'], 'url': row['url']})
+
+    comments_by_post = {}
+    cursor.execute("""
+        SELECT c.id, c.post_id, c.user_id as userId, c.text, c.created_at, c.likes_count,
+               u.name as author, u.initials, u.type
+        FROM comments c
+        JOIN users u ON c.user_id = u.id
+        WHERE c.post_id IN (SELECT value FROM json_each(?))
+        ORDER BY c.likes_count DESC, c.created_at DESC
+    """, (post_ids,))
+    for row in cursor.fetchall():
+        comments_by_post.setdefault(row['post_id'], []).append({
+            'id': row['id'],
+            'userId': row['userId'],
+            'author': row['author'],
+            'initials': row['initials'],
+            'type': row['type'],
+            'text': row['text'],
+            'likes': row['likes_count'],
+            'created_at': row['created_at']
+        })
+
+    polls_by_post = {}
+    cursor.execute("""
+        SELECT id, post_id, question FROM polls
+        WHERE post_id IN (SELECT value FROM json_each(?))
+        ORDER BY rowid
+    """, (post_ids,))
+    for row in cursor.fetchall():
+        polls_by_post.setdefault(row['post_id'], dict_from_row(row))
+
+    poll_summaries = poll_tally.summaries(cursor, [poll['id'] for poll in polls_by_post.values()])
+
+    body = []
+    for post in posts:
+        poll = polls_by_post.get(post['id'])
+        poll_data = None
+        if poll:
+            poll_data = {**poll_summaries[poll['id']], 'question': poll['question']}
+
+        body.append({
+            'id': post['id'],
+            'userId': post['userId'],
+            'author': post['author'],
+            'initials': post['initials'],
+            'age': post['age'],
+            'type': post['type'],
+            'text': post['text'],
+            'media': media_by_post.get(post['id'], []),
+            'likes': post['likes'],
+            'created_at': post['created_at'],
+            'comments': comments_by_post.get(post['id'], []),
+            'poll': poll_data
+        })
+
+    return body
+
+
+def load_viewer_state(cursor, body, user_id):
+    if not body:
+        return set(), set(), {}
+
+    post_ids = json.dumps([post['id'] for post in body])
+
+    cursor.execute("""
+        SELECT post_id FROM likes
+        WHERE user_id = ? AND post_id IN (SELECT value FROM json_each(?))
+    """, (user_id, post_ids))
+    liked_posts = {row[0] for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT cl.comment_id
+        FROM comment_likes cl
+        JOIN comments c ON cl.comment_id = c.id
+        WHERE cl.user_id = ? AND c.post_id IN (SELECT value FROM json_each(?))
+    """, (user_id, post_ids))
+    liked_comments = {row[0] for row in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT pv.poll_id, pv.option_id
+        FROM poll_votes pv
+        JOIN polls pl ON pv.poll_id = pl.id
+        WHERE pv.user_id = ? AND pl.post_id IN (SELECT value FROM json_each(?))
+    """, (user_id, post_ids))
+    user_votes = {row[0]: row[1] for row in cursor.fetchall()}
+
+    return liked_posts, liked_comments, user_votes
+
+
+def apply_viewer_overlay(body, viewer_state):
+    # Builds fresh dicts so the cached body is never mutated.
+    liked_posts, liked_comments, user_votes = viewer_state
+    result = []
+    for post in body:
+        poll_data = post['poll']
+        if poll_data:
+            poll_data = {**poll_data, 'userVote': user_votes.get(poll_data['id'])}
+
+        result.append({
+            'id': post['id'],
+            'userId': post['userId'],
+            'author': post['author'],
+            'initials': post['initials'],
+            'age': post['age'],
+            'type': post['type'],
+            'text': post['text'],
+            'media': post['media'],
+            'likes': post['likes'],
+            'liked': post['id'] in liked_posts,
+            'time': format_time_ago(post['created_at']),
+            'comments': [{
+                'id': c['id'],
+                'userId': c['userId'],
+                'author': c['author'],
+                'initials': c['initials'],
+                'type': c['type'],
+                'text': c['text'],
+                'likes': c['likes'],
+                'liked': c['id'] in liked_comments,
+                'time': format_time_ago(c['created_at'])
+            } for c in post['comments']],
+            'poll': poll_data
+        })
+
+    return result
+
+
+def hydrate_posts(cursor, posts, user_id):
+    body = load_feed_body(cursor, posts)
+    return apply_viewer_overlay(body, load_viewer_state(cursor, body, user_id))
+
+
+def load_feed_page(cursor, user_id, word_id=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    key = (word_id, after, limit)
+    page = feed_cache.get(key)
+    if page is None:
+        version = feed_cache.version
+        posts, next_cursor = fetch_post_page(cursor, word_id, after, limit)
+        page = (load_feed_body(cursor, posts), next_cursor)
+        feed_cache.put(key, version, page)
+
+    body, next_cursor = page
+    return {
+        'posts': apply_viewer_overlay(body, load_viewer_state(cursor, body, user_id)),
+        'nextCursor': next_cursor
+    }
+
+
+def load_first_page(user_id, word_id=None, limit=DEFAULT_PAGE_SIZE):
+    # The first page embedded in a server-rendered feed, built exactly as
+    # /api/posts builds it. None leaves the page to fetch it itself.
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        return load_feed_page(conn.cursor(), user_id, word_id, None, limit)
+    except sqlite3.Error as err:
+        print(f"Error loading first feed page: {err}")
+        return None
+    finally:
+        conn.close()
@@ -0,0 +1,13 @@
+import os
+
+# Notification streams stay open for up to BRIDGEGEN_NOTIFY_STREAM_SECONDS,
+# so workers are gevent: an idle stream is a parked greenlet rather than a
+# thread, and one worker holds thousands of them. gevent patches threading,
+# queue and time, so the hub, the pool and the background tasks cooperate
+# with it; SQLite calls still run to completion, and they are all short.
+bind = os.environ.get('BRIDGEGEN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('BRIDGEGEN_WORKERS', 2))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('BRIDGEGEN_WORKER_CONNECTIONS', 10000))
+timeout = 30
+graceful_timeout = 30
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, jsonify, request
+
+from background import PeriodicTask
+from database import get_db
+
+IDEMPOTENCY_TTL = float(os.environ.get('BRIDGEGEN_IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_CLAIM_TIMEOUT = float(os.environ.get('BRIDGEGEN_IDEMPOTENCY_CLAIM_TIMEOUT', 60))
+IDEMPOTENCY_WAIT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+IDEMPOTENT_METHODS = ('POST', 'PUT')
+# Uploads are stored by content hash, so repeating one already returns the
+# same media id; a key would only risk replaying a different file's id.
+UNKEYED_ENDPOINTS = ('upload_media',)
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    # Remembers the responses to recent requests that carried an
+    # Idempotency-Key header, so a retried write is answered from the stored
+    # response instead of being applied again. Keys live in the
+    # idempotency_keys table, so a retry is recognised by whichever worker
+    # it lands on. A key is claimed before the view runs; a duplicate that
+    # arrives while the first request is still in flight polls for its
+    # response rather than racing it into the database. Server errors are
+    # not stored, so the client can retry them with the same key. A claim
+    # whose request never finished (its worker died) can be taken over
+    # after `claim_timeout` seconds.
+
+    def __init__(self, ttl=86400, claim_timeout=60):
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.stored = 0
+        self.conflicts = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _try_claim(self, scope, key, fingerprint):
+        # Inserts the claim, or takes over a row that has expired. Returns
+        # (True, None) once claimed, else (False, the row in the way); the
+        # row is None if it was pruned in between.
+        now = time.time()
+        conn = get_db()
+        if not conn:
+            raise sqlite3.OperationalError('Database connection failed')
+        try:
+            cursor = conn.execute("""
+                INSERT INTO idempotency_keys (scope, key, fingerprint, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (scope, key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint, status = NULL, headers = NULL, body = NULL,
+                    updated_at = excluded.updated_at
+                WHERE idempotency_keys.updated_at < CASE WHEN idempotency_keys.status IS NULL THEN ? ELSE ? END
+            """, (scope, key, fingerprint, now, now - self.claim_timeout, now - self.ttl))
+            conn.commit()
+            if cursor.rowcount:
+                return True, None
+            return False, self._read(conn, scope, key)
+        finally:
+            conn.close()
+
+    def _read(self, conn, scope, key):
+        return conn.execute(
+            "SELECT fingerprint, status, headers, body FROM idempotency_keys WHERE scope = ? AND key = ?",
+            (scope, key)
+        ).fetchone()
+
+    def _wait(self, scope, key, deadline):
+        # Polls a claim that is still in flight with plain reads, so waiting
+        # does not queue for the write lock, and holds a pooled connection
+        # only for each read, not while sleeping. Returns the row once it is
+        # no longer pending, None if it was released, or the pending row at
+        # the deadline.
+        while True:
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+            conn = get_db()
+            if not conn:
+                raise sqlite3.OperationalError('Database connection failed')
+            try:
+                row = self._read(conn, scope, key)
+            finally:
+                conn.close()
+            if row is None or row['status'] is not None or time.monotonic() >= deadline:
+                return row
+
+    def claim(self, scoped_key, fingerprint, timeout=IDEMPOTENCY_WAIT):
+        # Returns ('new', None), ('replay', response) or ('conflict', None).
+        # Raises sqlite3.Error if the key cannot be checked.
+        scope, key = scoped_key
+        deadline = time.monotonic() + timeout
+        while True:
+            claimed, row = self._try_claim(scope, key, fingerprint)
+            if claimed:
+                return 'new', None
+            if row is not None and row['fingerprint'] == fingerprint and row['status'] is None:
+                row = self._wait(scope, key, deadline)
+            if row is None:
+                continue
+            if row['fingerprint'] != fingerprint or row['status'] is None:
+                self._count('conflicts')
+                return 'conflict', None
+            self._count('replays')
+            return 'replay', (row['status'], json.loads(row['headers']), row['body'])
+
+    def complete(self, scoped_key, response):
+        status, headers, body = response
+        conn = get_db()
+        if not conn:
+            return
+        try:
+            cursor = conn.execute("""
+                UPDATE idempotency_keys SET status = ?, headers = ?, body = ?, updated_at = ?
+                WHERE scope = ? AND key = ? AND status IS NULL
+            """, (status, json.dumps(headers), body, time.time(), *scoped_key))
+            conn.commit()
+            if cursor.rowcount:
+                self._count('stored')
+        except sqlite3.Error as err:
+            print(f"Error storing idempotent response: {err}")
+        finally:
+            conn.close()
+
+    def release(self, scoped_key):
+        conn = get_db()
+        if not conn:
+            return
+        try:
+            conn.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ? AND status IS NULL", scoped_key)
+            conn.commit()
+        except sqlite3.Error as err:
+            print(f"Error releasing idempotency key: {err}")
+        finally:
+            conn.close()
+
+    def prune(self):
+        now = time.time()
+        conn = get_db()
+        if not conn:
+            return None
+        try:
+            pruned = conn.execute(
+                "DELETE FROM idempotency_keys WHERE updated_at < ? AND status IS NOT NULL", (now - self.ttl,)
+            ).rowcount
+            abandoned = conn.execute(
+                "DELETE FROM idempotency_keys WHERE updated_at < ? AND status IS NULL", (now - self.claim_timeout,)
+            ).rowcount
+            conn.commit()
+            return {'pruned': pruned, 'abandoned': abandoned}
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'claimTimeout': self.claim_timeout,
+                'stored': self.stored,
+                'replays': self.replays,
+                'conflicts': self.conflicts,
+                'pruner': idempotency_pruner.stats()
+            }
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL, IDEMPOTENCY_CLAIM_TIMEOUT)
+idempotency_pruner = PeriodicTask('idempotency-pruner', 3600, idempotency_store.prune)
+
+
+def claim_idempotency_key():
+    if request.method not in IDEMPOTENT_METHODS or request.endpoint in UNKEYED_ENDPOINTS:
+        return None
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+    # The key is scoped to the endpoint and the acting user, so two users
+    # who happen to pick the same key never see each other's responses. The
+    # body fingerprint catches a client that reuses a key for a different
+    # request.
+    data = request.get_json(silent=True)
+    user_id = data.get('userId') if isinstance(data, dict) else None
+    user_id = user_id or request.args.get('userId', '')
+    scoped_key = (f'{request.method} {request.path} {user_id}', key)
+    fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+    try:
+        outcome, stored = idempotency_store.claim(scoped_key, fingerprint)
+    except sqlite3.Error as err:
+        print(f"Error claiming idempotency key: {err}")
+        return jsonify({'error': 'Could not check Idempotency-Key'}), 500
+    if outcome == 'conflict':
+        return jsonify({'error': 'Idempotency-Key is already in use for a different or unfinished request'}), 409
+    if outcome == 'replay':
+        status, headers, body = stored
+        return body, status, {**headers, 'Idempotent-Replayed': 'true'}
+    g.idempotency_key = scoped_key
+    return None
+
+
+def store_idempotent_response(response):
+    scoped_key = g.pop('idempotency_key', None)
+    if scoped_key is None:
+        return response
+    if response.status_code >= 500 or response.is_streamed:
+        idempotency_store.release(scoped_key)
+        return response
+    headers = {'Content-Type': response.headers.get('Content-Type', 'application/json')}
+    idempotency_store.complete(scoped_key, (response.status_code, headers, response.get_data()))
+    return response
+
+
+def release_idempotency_key(error=None):
+    # Runs after every request; anything still claimed here failed before a
+    # response was stored.
+    scoped_key = g.pop('idempotency_key', None)
+    if scoped_key is not None:
+        idempotency_store.release(scoped_key)
+
+
+def register_idempotency(app):
+    app.before_request(claim_idempotency_key)
+    app.after_request(store_idempotent_response)
+    app.teardown_request(release_idempotency_key)
+
+
+def start_idempotency_pruner():
+    idempotency_pruner.start()
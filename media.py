@@ -0,0 +1,230 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+MEDIA_DIR = os.environ.get('BRIDGEGEN_MEDIA_DIR', os.path.join(os.path.dirname(__file__), 'media'))
+MEDIA_URL_PREFIX = '/media/'
+MAX_MEDIA_BYTES = int(os.environ.get('BRIDGEGEN_MAX_MEDIA_BYTES', 50 * 1024 * 1024))
+MEDIA_MAX_AGE = 365 * 24 * 3600
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+MEDIA_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'video/mp4': '.mp4',
+    'video/webm': '.webm',
+    'video/quicktime': '.mov',
+}
+
+# Leading bytes each accepted type must start with; (offset, prefix) pairs.
+MEDIA_SIGNATURES = {
+    'image/jpeg': [(0, b'\xff\xd8\xff')],
+    'image/png': [(0, b'\x89PNG\r\n\x1a\n')],
+    'image/gif': [(0, b'GIF87a'), (0, b'GIF89a')],
+    'image/webp': [(8, b'WEBP')],
+    'video/mp4': [(4, b'ftyp')],
+    'video/webm': [(0, b'\x1a\x45\xdf\xa3')],
+    'video/quicktime': [(4, b'ftyp'), (4, b'moov'), (4, b'wide'), (4, b'mdat')],
+}
+SIGNATURE_BYTES = 12
+
+DATA_URL_PATTERN = re.compile(r'data:([\w.+-]+/[\w.+-]+)?(?:;[\w-]+=[^;,]*)*;base64,', re.ASCII)
+MEDIA_NAME_PATTERN = re.compile(r'[0-9a-f]{64}\.[a-z0-9]+', re.ASCII)
+
+# Uploaded files are stored once per distinct content, named by the SHA-256
+# of their bytes and sharded by the first two hex digits. A name therefore
+# always refers to the same bytes, which is what lets /media responses be
+# cached as immutable. post_media keeps only the short /media/ URL.
+
+
+class MediaTooLarge(ValueError):
+    pass
+
+
+def media_path(name):
+    if not isinstance(name, str) or not MEDIA_NAME_PATTERN.fullmatch(name):
+        return None
+    return os.path.join(MEDIA_DIR, name[:2], name)
+
+
+def media_kind(name):
+    extension = os.path.splitext(name)[1]
+    for mime_type, known in MEDIA_EXTENSIONS.items():
+        if known == extension:
+            return mime_type.split('/')[0]
+    return None
+
+
+class PendingUpload:
+    # A media file being written to a temporary file in MEDIA_DIR and hashed
+    # as it goes. finish() renames it to its content name, which is atomic,
+    # so readers never see a partial file; an identical file that is already
+    # stored wins and the new copy is dropped.
+
+    def __init__(self, mime_type):
+        self.extension = MEDIA_EXTENSIONS.get(mime_type)
+        if self.extension is None:
+            raise ValueError(f'Unsupported media type: {mime_type}')
+        self.mime_type = mime_type
+        self.size = 0
+        self._head = b''
+        self._hash = hashlib.sha256()
+        os.makedirs(MEDIA_DIR, exist_ok=True)
+        fd, self._path = tempfile.mkstemp(dir=MEDIA_DIR, prefix='.upload-')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > MAX_MEDIA_BYTES:
+            raise MediaTooLarge(f'Media exceeds {MAX_MEDIA_BYTES // (1024 * 1024)} MB')
+        if len(self._head) < SIGNATURE_BYTES:
+            self._head += chunk[:SIGNATURE_BYTES - len(self._head)]
+            if len(self._head) >= SIGNATURE_BYTES:
+                self._check_signature()
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def _check_signature(self):
+        signatures = MEDIA_SIGNATURES[self.mime_type]
+        if not any(self._head[offset:offset + len(prefix)] == prefix for offset, prefix in signatures):
+            raise ValueError(f'File content is not {self.mime_type}')
+
+    def finish(self):
+        if len(self._head) < SIGNATURE_BYTES:
+            self._check_signature()
+        self._file.close()
+        name = self._hash.hexdigest() + self.extension
+        path = media_path(name)
+        if os.path.exists(path):
+            os.unlink(self._path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._path, path)
+        return MEDIA_URL_PREFIX + name
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+def store_media_bytes(data, mime_type):
+    upload = PendingUpload(mime_type)
+    try:
+        upload.write(data)
+        return upload.finish()
+    except (OSError, ValueError):
+        upload.discard()
+        raise
+
+
+def receive_upload(stream, boundary):
+    # Parses a multipart body incrementally and streams its single file part
+    # to disk, so memory use does not grow with the file. The part's declared
+    # type is checked before any of its data is read and its leading bytes
+    # as soon as they arrive. Returns the stored media URL.
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=UPLOAD_OVERHEAD_BYTES)
+    upload = None
+    stored_url = None
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                decoder.receive_data(stream.read(UPLOAD_CHUNK_SIZE) or None)
+            elif isinstance(event, File):
+                if upload is not None or stored_url is not None:
+                    raise ValueError('Upload one file per request')
+                mime_type = event.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                upload = PendingUpload(mime_type)
+            elif isinstance(event, Data) and upload is not None:
+                upload.write(event.data)
+                if not event.more_data:
+                    stored_url = upload.finish()
+                    upload = None
+            elif isinstance(event, Epilogue):
+                break
+    finally:
+        if upload is not None:
+            upload.discard()
+    if stored_url is None:
+        raise ValueError('No file in upload')
+    return stored_url
+
+
+def decode_data_url(url):
+    match = DATA_URL_PATTERN.match(url)
+    if not match:
+        raise ValueError('Media must be a base64 data URL')
+    try:
+        data = base64.b64decode(url[match.end():], validate=True)
+    except binascii.Error:
+        raise ValueError('Media is not valid base64')
+    return match.group(1), data
+
+
+def store_media_url(media_type, url):
+    # Returns the URL to keep in post_media: data URLs are written to disk
+    # and replaced by their /media/ URL; URLs that already point at stored
+    # media or elsewhere are kept as they are.
+    if media_type not in ('image', 'video'):
+        raise ValueError(f'Unsupported media type: {media_type}')
+    if not url.startswith('data:'):
+        return url
+    mime_type, data = decode_data_url(url)
+    if not mime_type or mime_type.split('/')[0] != media_type:
+        raise ValueError(f'Media of type {media_type} cannot be {mime_type or "untyped"}')
+    return store_media_bytes(data, mime_type)
+
+
+def resolve_post_media(items):
+    # Posts refer to media uploaded through /api/media by id, or keep the
+    # /media/ URL of media they already have. Anything else, inline blobs
+    # and outside URLs included, is rejected with ValueError.
+    if not isinstance(items, list):
+        raise ValueError('media must be a list')
+    resolved = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Each media item must be an object')
+        name = item.get('id')
+        if name is None:
+            url = item.get('url')
+            if isinstance(url, str) and url.startswith('data:'):
+                raise ValueError('Upload media through /api/media and send its id')
+            if not isinstance(url, str) or not url.startswith(MEDIA_URL_PREFIX):
+                raise ValueError('Media must be uploaded through /api/media')
+            name = url[len(MEDIA_URL_PREFIX):]
+        path = media_path(name)
+        kind = media_kind(name) if path else None
+        if not kind or not os.path.isfile(path):
+            raise ValueError(f'Unknown media: {name!r}')
+        resolved.append({'type': kind, 'url': MEDIA_URL_PREFIX + name})
+    return resolved
+
+
+def extract_inline_media(conn):
+    # Migration step: moves data URLs already stored in post_media to disk.
+    # Rows are read one at a time since each url can be several megabytes.
+    ids = [row[0] for row in conn.execute("SELECT id FROM post_media WHERE substr(url, 1, 5) = 'data:'")]
+    moved = 0
+    for media_id in ids:
+        media_type, url = conn.execute("SELECT media_type, url FROM post_media WHERE id = ?", (media_id,)).fetchone()
+        try:
+            stored_url = store_media_url(media_type, url)
+        except ValueError as err:
+            print(f"Leaving post_media {media_id} inline: {err}")
+            continue
+        conn.execute("UPDATE post_media SET url = ? WHERE id = ?", (stored_url, media_id))
+        moved += 1
+    if ids:
+        print(f"Moved {moved} of {len(ids)} inline media items to {MEDIA_DIR}")
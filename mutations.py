@@ -0,0 +1,420 @@
+import atexit
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from background import PeriodicTask
+from counters import add_delta, read_counter
+from database import get_db, open_connection
+from feed import poll_tally
+
+
+# Interaction writes. Each one runs as a single BEGIN IMMEDIATE transaction,
+# so the write lock is held from the first read and two concurrent clicks
+# can never both see "not liked yet". Counters are adjusted in the same
+# transaction as the join-table row, which keeps each toggle to a fixed
+# three statements. Post likes and poll votes go through the delta store
+# in counters.py instead of rewriting the (wide, hot) post or option row.
+#
+# The command bodies below never begin or commit; execute() decides whether
+# a command gets its own transaction or joins a group commit on the writer
+# thread.
+
+WRITE_BATCHING = os.environ.get('BRIDGEGEN_WRITE_BATCHING', '0') == '1'
+WRITE_BATCH_SIZE = int(os.environ.get('BRIDGEGEN_WRITE_BATCH_SIZE', 64))
+WRITE_BATCH_DELAY = float(os.environ.get('BRIDGEGEN_WRITE_BATCH_DELAY_MS', 2)) / 1000
+WRITE_TIMEOUT = 10
+
+MAX_BATCH_OPERATIONS = 50
+INTERACTION_KEY_TTL_HOURS = 24
+
+
+def _toggle(conn, table, column, target_id, user_id):
+    removed = conn.execute(
+        f"DELETE FROM {table} WHERE {column} = ? AND user_id = ? RETURNING 1",
+        (target_id, user_id)
+    ).fetchone() is not None
+    if not removed:
+        conn.execute(
+            f"INSERT INTO {table} ({column}, user_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            (target_id, user_id)
+        )
+    return removed
+
+
+def _toggle_post_like(conn, post_id, user_id):
+    removed = _toggle(conn, 'likes', 'post_id', post_id, user_id)
+    add_delta(conn, 'post_likes', post_id, -1 if removed else 1)
+    return read_counter(conn, 'post_likes', post_id), not removed
+
+
+def _toggle_comment_like(conn, comment_id, user_id):
+    removed = _toggle(conn, 'comment_likes', 'comment_id', comment_id, user_id)
+    row = conn.execute(
+        "UPDATE comments SET likes_count = likes_count + ? WHERE id = ? RETURNING likes_count",
+        (-1 if removed else 1, comment_id)
+    ).fetchone()
+    return (row[0] if row else 0), not removed
+
+
+def _set_like(conn, table, column, target_id, user_id, liked):
+    # Idempotent form of _toggle for clients that send the state they want;
+    # returns whether anything changed.
+    if liked:
+        sql = f"INSERT INTO {table} ({column}, user_id) VALUES (?, ?) ON CONFLICT DO NOTHING RETURNING 1"
+    else:
+        sql = f"DELETE FROM {table} WHERE {column} = ? AND user_id = ? RETURNING 1"
+    return conn.execute(sql, (target_id, user_id)).fetchone() is not None
+
+
+def _set_post_like(conn, post_id, user_id, liked):
+    changed = _set_like(conn, 'likes', 'post_id', post_id, user_id, liked)
+    if changed:
+        add_delta(conn, 'post_likes', post_id, 1 if liked else -1)
+    return read_counter(conn, 'post_likes', post_id), changed
+
+
+def _set_comment_like(conn, comment_id, user_id, liked):
+    changed = _set_like(conn, 'comment_likes', 'comment_id', comment_id, user_id, liked)
+    if changed:
+        sql = "UPDATE comments SET likes_count = likes_count + ? WHERE id = ? RETURNING likes_count"
+        row = conn.execute(sql, (1 if liked else -1, comment_id)).fetchone()
+    else:
+        row = conn.execute("SELECT likes_count FROM comments WHERE id = ?", (comment_id,)).fetchone()
+    return (row[0] if row else 0), changed
+
+
+def _add_comment(conn, post_id, data):
+    conn.execute(
+        "INSERT INTO users (id, name, initials, age, type) VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING",
+        (data['userId'], data['author'], data['initials'], data.get('age', 18), data['type'])
+    )
+    comment_id = f"c-{secrets.token_hex(4)}"
+    conn.execute(
+        "INSERT INTO comments (id, post_id, user_id, text) VALUES (?, ?, ?, ?)",
+        (comment_id, post_id, data['userId'], data['text'])
+    )
+    return {
+        'id': comment_id,
+        'userId': data['userId'],
+        'author': data['author'],
+        'initials': data['initials'],
+        'type': data['type'],
+        'text': data['text'],
+        'likes': 0,
+        'liked': False,
+        'time': 'Just now'
+    }
+
+
+def _cast_poll_vote(conn, poll_id, option_id, user_id):
+    # Returns the per-option count changes as (delta id, option id, +1/-1).
+    # DELETE ... RETURNING yields the previous vote without a separate read;
+    # a repeat vote raises and the rollback restores the row.
+    existing = conn.execute(
+        "DELETE FROM poll_votes WHERE poll_id = ? AND user_id = ? RETURNING option_id",
+        (poll_id, user_id)
+    ).fetchone()
+    old_option_id = existing[0] if existing else None
+    if old_option_id == option_id:
+        raise ValueError('Already voted for this option')
+
+    known = poll_tally.has_option(poll_id, option_id)
+    if known is None:
+        known = conn.execute(
+            "SELECT 1 FROM poll_options WHERE id = ? AND poll_id = ?", (option_id, poll_id)
+        ).fetchone() is not None
+    if not known:
+        raise ValueError('Invalid poll option')
+
+    conn.execute(
+        "INSERT INTO poll_votes (poll_id, option_id, user_id) VALUES (?, ?, ?)",
+        (poll_id, option_id, user_id)
+    )
+    changes = {option_id: 1}
+    if old_option_id:
+        changes[old_option_id] = -1
+    moves = [(add_delta(conn, 'poll_votes', target_id, delta), target_id, delta)
+             for target_id, delta in changes.items()]
+    return moves, existing is None
+
+
+def _apply_operation(conn, user_id, op):
+    # Returns (result, effects): the client-facing result and what has to
+    # happen once the transaction commits (tally moves, notifications).
+    kind = op.get('op')
+    if kind in ('like', 'unlike'):
+        likes, changed = _set_post_like(conn, op['postId'], user_id, kind == 'like')
+        notify = [('post_like', {'post_id': op['postId']})] if changed and kind == 'like' else []
+        return {'postId': op['postId'], 'likes': likes, 'liked': kind == 'like'}, {'notify': notify}
+    if kind in ('likeComment', 'unlikeComment'):
+        likes, changed = _set_comment_like(conn, op['commentId'], user_id, kind == 'likeComment')
+        notify = []
+        if changed and kind == 'likeComment':
+            notify = [('comment_like', {'post_id': op.get('postId'), 'comment_id': op['commentId']})]
+        return {'commentId': op['commentId'], 'likes': likes, 'liked': kind == 'likeComment'}, {'notify': notify}
+    if kind == 'vote':
+        moves, is_new_vote = _cast_poll_vote(conn, op['pollId'], op['optionId'], user_id)
+        notify = [('poll_vote', {'poll_id': op['pollId']})] if is_new_vote else []
+        return {'pollId': op['pollId'], 'userVote': op['optionId']}, {'notify': notify, 'moves': moves}
+    if kind == 'comment':
+        comment = _add_comment(conn, op['postId'], {**op, 'userId': user_id})
+        notify = [('comment', {'actor_name': comment['author'], 'post_id': op['postId'], 'comment_id': comment['id']})]
+        return {'postId': op['postId'], 'comment': comment}, {'notify': notify}
+    raise ValueError(f'Unknown operation: {kind}')
+
+
+def _apply_batch(conn, user_id, operations):
+    # Applies operations in order, each under its own savepoint so one bad
+    # operation does not undo the others. A key that has already been
+    # applied returns its stored result instead of applying it again.
+    outcomes = []
+    for op in operations:
+        key = op.get('key')
+        if key:
+            row = conn.execute(
+                "SELECT result FROM interaction_keys WHERE user_id = ? AND key = ?", (user_id, key)
+            ).fetchone()
+            if row:
+                outcomes.append(({**json.loads(row[0]), 'replayed': True}, None))
+                continue
+
+        conn.execute("SAVEPOINT interaction")
+        try:
+            result, effects = _apply_operation(conn, user_id, op)
+            result = {'key': key, 'op': op.get('op'), 'ok': True, **result}
+            if key:
+                conn.execute(
+                    "INSERT INTO interaction_keys (user_id, key, result) VALUES (?, ?, ?)",
+                    (user_id, key, json.dumps(result))
+                )
+        except (sqlite3.Error, ValueError, KeyError) as err:
+            conn.execute("ROLLBACK TO interaction")
+            message = f'Missing field: {err}' if isinstance(err, KeyError) else str(err)
+            result, effects = {'key': key, 'op': op.get('op'), 'ok': False, 'error': message}, None
+        conn.execute("RELEASE interaction")
+        outcomes.append((result, effects))
+    return outcomes
+
+
+def run_in_transaction(conn, command, *args):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = command(conn, *args)
+        conn.commit()
+    except (sqlite3.Error, ValueError):
+        conn.rollback()
+        raise
+    return result
+
+
+class WriteBatcher:
+    # Group commit for interaction writes. One thread owns the write path:
+    # it takes whatever commands have queued up (at most batch_size, waiting
+    # at most max_delay for more), runs each under its own savepoint inside
+    # one transaction, commits once, and then resolves every caller's
+    # future. A command that fails rolls back only its own savepoint.
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._accepting = False
+        self._lock = threading.Lock()
+        self.commands = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.failed_batches = 0
+        self.commit_time = 0.0
+
+    @property
+    def running(self):
+        return self._accepting
+
+    def start(self):
+        with self._lock:
+            if self._accepting:
+                return
+            self._accepting = True
+        self._thread = threading.Thread(target=self._run, name='write-batcher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        # Commands accepted before this call are committed before it
+        # returns; later ones fall back to their own transaction.
+        with self._lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, command, *args):
+        future = Future()
+        with self._lock:
+            if not self._accepting:
+                return None
+            self._queue.put((future, command, args))
+        return future
+
+    def _run(self):
+        # The writer keeps its own connection: request threads hold pool
+        # connections while they wait on their futures.
+        conn = open_connection()
+        try:
+            self._drain(conn)
+        finally:
+            conn.close()
+
+    def _drain(self, conn):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        start = time.monotonic()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for _, command, args in batch:
+                conn.execute("SAVEPOINT write_command")
+                try:
+                    results.append((True, command(conn, *args)))
+                except Exception as err:
+                    conn.execute("ROLLBACK TO write_command")
+                    results.append((False, err))
+                conn.execute("RELEASE write_command")
+            conn.commit()
+        except sqlite3.Error as err:
+            conn.rollback()
+            with self._lock:
+                self.failed_batches += 1
+            for future, _, _ in batch:
+                future.set_exception(err)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.commands += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.commit_time += time.monotonic() - start
+        for (future, _, _), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._accepting,
+                'batchSize': self.batch_size,
+                'maxDelayMs': self.max_delay * 1000,
+                'depth': self._queue.qsize(),
+                'commands': self.commands,
+                'batches': self.batches,
+                'avgBatch': round(self.commands / self.batches, 2) if self.batches else 0,
+                'largestBatch': self.largest_batch,
+                'failedBatches': self.failed_batches,
+                'avgCommitMs': round(self.commit_time / self.batches * 1000, 3) if self.batches else 0
+            }
+
+
+write_batcher = WriteBatcher()
+
+
+def start_write_batcher():
+    if WRITE_BATCHING:
+        write_batcher.start()
+    key_pruner.start()
+
+
+def execute(conn, command, *args):
+    future = write_batcher.submit(command, *args)
+    if future is None:
+        return run_in_transaction(conn, command, *args)
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeoutError:
+        raise sqlite3.OperationalError('Timed out waiting for the write queue')
+
+
+def toggle_post_like(conn, post_id, user_id):
+    return execute(conn, _toggle_post_like, post_id, user_id)
+
+
+def toggle_comment_like(conn, comment_id, user_id):
+    return execute(conn, _toggle_comment_like, comment_id, user_id)
+
+
+def add_comment(conn, post_id, data):
+    return execute(conn, _add_comment, post_id, data)
+
+
+def apply_interactions(conn, user_id, operations):
+    # Returns (results, notifications). Vote results carry the poll's
+    # current counts, also when they are replays of an earlier request.
+    outcomes = execute(conn, _apply_batch, user_id, operations)
+    cursor = conn.cursor()
+    results = []
+    notifications = []
+    for result, effects in outcomes:
+        poll = None
+        if effects:
+            if effects.get('moves'):
+                poll = poll_tally.apply_vote(cursor, result['pollId'], effects['moves'])
+            notifications.extend(effects['notify'])
+        if result['ok'] and result['op'] == 'vote':
+            poll = poll or poll_tally.summaries(cursor, [result['pollId']])[result['pollId']]
+            result = {**result, 'poll': {**poll, 'userVote': result['userVote']}}
+        results.append(result)
+    return results, notifications
+
+
+def prune_interaction_keys():
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        cursor = conn.execute(
+            "DELETE FROM interaction_keys WHERE created_at < datetime('now', ?)",
+            (f'-{INTERACTION_KEY_TTL_HOURS} hours',)
+        )
+        conn.commit()
+        return {'pruned': cursor.rowcount}
+    finally:
+        conn.close()
+
+
+key_pruner = PeriodicTask('interaction-key-pruner', 3600, prune_interaction_keys)
+
+
+def cast_poll_vote(conn, poll_id, option_id, user_id):
+    # Returns (poll, is_new_vote), with poll in the format_poll shape and its
+    # question left out. Raises ValueError for a repeat vote or an option
+    # that does not belong to the poll; nothing is written then. The tally
+    # is only updated once the vote has committed.
+    moves, is_new_vote = execute(conn, _cast_poll_vote, poll_id, option_id, user_id)
+    poll = poll_tally.apply_vote(conn.cursor(), poll_id, moves)
+    return {**poll, 'userVote': option_id}, is_new_vote
@@ -0,0 +1,659 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from background import PeriodicTask
+from database import get_db
+from feed import format_time_ago
+
+NOTIFICATION_PAGE_SIZE = 20
+COUNTER_CHECK_INTERVAL = float(os.environ.get('BRIDGEGEN_NOTIFY_COUNTER_CHECK_INTERVAL', 3600))
+RETENTION_MAX_PER_USER = int(os.environ.get('BRIDGEGEN_NOTIFY_MAX_PER_USER', 200))
+RETENTION_TTL_DAYS = int(os.environ.get('BRIDGEGEN_NOTIFY_TTL_DAYS', 90))
+COMPACT_INTERVAL = float(os.environ.get('BRIDGEGEN_NOTIFY_COMPACT_INTERVAL', 900))
+COMPACT_BATCH_SIZE = 500
+COMPACT_BATCH_PAUSE = 0.01
+VACUUM_PAGES = 1000
+HEARTBEAT_SECONDS = 25
+STREAM_LIFETIME = float(os.environ.get('BRIDGEGEN_NOTIFY_STREAM_SECONDS', 3600))
+SUBSCRIBER_QUEUE_SIZE = 50
+TAIL_INTERVAL = float(os.environ.get('BRIDGEGEN_NOTIFY_TAIL_INTERVAL', 1))
+TAIL_BATCH_SIZE = 500
+EVENT_RETENTION_MINUTES = 60
+
+DISPATCH_QUEUE_SIZE = int(os.environ.get('BRIDGEGEN_NOTIFY_QUEUE_SIZE', 10000))
+DISPATCH_BATCH_SIZE = int(os.environ.get('BRIDGEGEN_NOTIFY_BATCH_SIZE', 200))
+DISPATCH_BATCH_WINDOW = float(os.environ.get('BRIDGEGEN_NOTIFY_BATCH_WINDOW', 0.05))
+DISPATCH_RETRIES = 3
+
+NOTIFICATION_COLUMNS = (
+    "id, user_id, type, actor_id, actor_name, post_id, comment_id, message, read, created_at, actor_count"
+)
+RECENT_ACTORS = 3
+
+# How each notification type finds its recipient and post, the message that
+# follows the actor's name, and the target its notifications are grouped by
+# (None keeps one row per event). Resolving these in the dispatcher keeps
+# the lookups out of the request that triggered the notification.
+NOTIFICATION_TYPES = {
+    'post_like': (
+        "SELECT user_id AS owner_id, id AS post_id FROM posts WHERE id = :post_id",
+        'liked your post',
+        't.post_id'
+    ),
+    'comment': (
+        "SELECT user_id AS owner_id, id AS post_id FROM posts WHERE id = :post_id",
+        'commented on your post',
+        None
+    ),
+    'comment_like': (
+        "SELECT user_id AS owner_id, post_id FROM comments WHERE id = :comment_id",
+        'liked your comment',
+        ':comment_id'
+    ),
+    'poll_vote': (
+        "SELECT p.user_id AS owner_id, p.id AS post_id FROM polls pl JOIN posts p ON pl.post_id = p.id WHERE pl.id = :poll_id",
+        'voted on your poll',
+        't.post_id'
+    )
+}
+
+
+def format_message(row):
+    others = row['actor_count'] - 1
+    if others < 1:
+        return row['message']
+    action = NOTIFICATION_TYPES[row['type']][1]
+    return f"{row['actor_name']} and {others} {'other' if others == 1 else 'others'} {action}"
+
+
+def format_notification(row):
+    return {
+        'id': row['id'],
+        'type': row['type'],
+        'actorId': row['actor_id'],
+        'actorName': row['actor_name'],
+        'postId': row['post_id'],
+        'commentId': row['comment_id'],
+        'message': format_message(row),
+        'read': bool(row['read']),
+        'time': format_time_ago(row['created_at']),
+        'actorCount': row['actor_count']
+    }
+
+
+def count_unread(cursor, user_id):
+    cursor.execute("SELECT unread_count FROM notification_state WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def load_notifications(cursor, user_id, limit=NOTIFICATION_PAGE_SIZE):
+    cursor.execute("""
+        SELECT n.id, n.type, n.actor_id, n.actor_name, n.post_id, n.comment_id, n.message,
+               n.read OR n.seq <= COALESCE(s.read_watermark, 0) AS read,
+               n.created_at, n.actor_count
+        FROM notifications n
+        LEFT JOIN notification_state s ON s.user_id = n.user_id
+        WHERE n.user_id = ? AND n.seq > COALESCE(s.cleared_watermark, 0)
+        ORDER BY n.seq DESC
+        LIMIT ?
+    """, (user_id, limit))
+    return [format_notification(row) for row in cursor.fetchall()]
+
+
+def mark_all_read(cursor, user_id):
+    cursor.execute("""
+        UPDATE notification_state SET read_watermark = last_seq, unread_count = 0
+        WHERE user_id = ?
+    """, (user_id,))
+
+
+def clear_all(cursor, user_id):
+    # Cleared rows stay in the table, hidden below the watermark, until
+    # compact_notifications deletes them.
+    cursor.execute("""
+        UPDATE notification_state
+        SET read_watermark = last_seq, cleared_watermark = last_seq, unread_count = 0
+        WHERE user_id = ?
+    """, (user_id,))
+
+
+def check_unread_counters(repair=True):
+    # Recounts every user's unread notifications from the rows themselves and
+    # rewrites any counter that has drifted. The triggers should keep them
+    # exact; this is the safety net for edits made outside them.
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        drifted = conn.execute("""
+            SELECT s.user_id, s.unread_count, s.last_seq,
+                   (SELECT COUNT(*) FROM notifications n
+                    WHERE n.user_id = s.user_id AND n.read = 0 AND n.seq > s.read_watermark) AS actual_unread,
+                   (SELECT COALESCE(MAX(n.seq), 0) FROM notifications n WHERE n.user_id = s.user_id) AS actual_seq
+            FROM notification_state s
+            WHERE s.unread_count != actual_unread OR s.last_seq < actual_seq
+        """).fetchall()
+        missing = conn.execute("""
+            SELECT COUNT(DISTINCT user_id) FROM notifications
+            WHERE user_id NOT IN (SELECT user_id FROM notification_state)
+        """).fetchone()[0]
+        if repair and (drifted or missing):
+            conn.executemany("""
+                UPDATE notification_state SET unread_count = ?, last_seq = MAX(last_seq, ?)
+                WHERE user_id = ?
+            """, [(row['actual_unread'], row['actual_seq'], row['user_id']) for row in drifted])
+            conn.execute("""
+                INSERT INTO notification_state (user_id, last_seq, unread_count)
+                SELECT user_id, MAX(seq), SUM(read = 0) FROM notifications
+                WHERE user_id NOT IN (SELECT user_id FROM notification_state)
+                GROUP BY user_id
+            """)
+        conn.commit()
+        return {'drifted': len(drifted), 'missing': missing, 'repaired': repair}
+    finally:
+        conn.close()
+
+
+counter_checker = PeriodicTask('notification-counter-check', COUNTER_CHECK_INTERVAL, check_unread_counters)
+
+
+def _delete_in_batches(conn, select_ids, params=(), table='notifications'):
+    # Each batch is its own short write transaction with a pause after it,
+    # so request writes queue behind at most one batch.
+    deleted = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(f"""
+                DELETE FROM {table} WHERE id IN ({select_ids} LIMIT {COMPACT_BATCH_SIZE})
+            """, params)
+            count = cursor.rowcount
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        deleted += count
+        if count < COMPACT_BATCH_SIZE:
+            return deleted
+        time.sleep(COMPACT_BATCH_PAUSE)
+
+
+def compact_notifications(max_per_user=RETENTION_MAX_PER_USER, ttl_days=RETENTION_TTL_DAYS):
+    # Deletes cleared rows, rows older than the TTL, anything past each
+    # user's newest max_per_user and stream events every tail has long
+    # since read, then returns the freed pages to the filesystem when the
+    # database uses incremental auto_vacuum.
+    conn = get_db()
+    if not conn:
+        return None
+    start = time.monotonic()
+    try:
+        cleared = _delete_in_batches(conn, """
+            SELECT n.id FROM notification_state s
+            JOIN notifications n ON n.user_id = s.user_id AND n.seq <= s.cleared_watermark
+        """)
+
+        expired = 0
+        if ttl_days > 0:
+            expired = _delete_in_batches(conn, """
+                SELECT id FROM notifications WHERE created_at < datetime('now', ?)
+            """, (f'-{ttl_days} days',))
+
+        capped = 0
+        if max_per_user > 0:
+            over_cap = conn.execute("""
+                SELECT user_id FROM notifications GROUP BY user_id HAVING COUNT(*) > ?
+            """, (max_per_user,)).fetchall()
+            for row in over_cap:
+                capped += _delete_in_batches(conn, """
+                    SELECT id FROM notifications
+                    WHERE user_id = :user_id AND seq < (
+                        SELECT seq FROM notifications WHERE user_id = :user_id
+                        ORDER BY seq DESC LIMIT 1 OFFSET :keep
+                    )
+                """, {'user_id': row['user_id'], 'keep': max_per_user - 1})
+
+        events = _delete_in_batches(conn, """
+            SELECT id FROM notification_events WHERE created_at < datetime('now', ?)
+        """, (f'-{EVENT_RETENTION_MINUTES} minutes',), table='notification_events')
+
+        vacuumed = None
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # executescript steps the pragma to completion; execute() would
+            # stop after the first page.
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+            vacuumed = freelist - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return {
+            'cleared': cleared,
+            'expired': expired,
+            'capped': capped,
+            'reclaimed': cleared + expired + capped,
+            'events': events,
+            'vacuumedPages': vacuumed,
+            'durationMs': round((time.monotonic() - start) * 1000, 3)
+        }
+    finally:
+        conn.close()
+
+
+compactor = PeriodicTask('notification-compactor', COMPACT_INTERVAL, compact_notifications)
+
+
+class NotificationHub:
+    # In-process pub/sub for the SSE stream, fed by NotificationTail. Each
+    # open stream owns a small bounded queue; under the gevent worker an
+    # idle connection costs one parked greenlet and no database work. A
+    # stream that stops draining loses events rather than growing without
+    # bound, and resyncs from /api/notifications when the browser
+    # reconnects. Streams end after `lifetime` seconds so a dead client is
+    # eventually let go; EventSource reconnects on its own.
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE, lifetime=STREAM_LIFETIME):
+        self.queue_size = queue_size
+        self.lifetime = lifetime
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+                self.published += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def stream(self, user_id):
+        q = self.subscribe(user_id)
+        deadline = time.monotonic() + self.lifetime
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    yield q.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(user_id, q)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscribers),
+                'connections': sum(len(s) for s in self._subscribers.values()),
+                'lifetime': self.lifetime,
+                'published': self.published,
+                'dropped': self.dropped
+            }
+
+
+hub = NotificationHub()
+
+
+class NotificationTail:
+    # Follows notification_events, which triggers fill in the same
+    # transaction as every notification write, and publishes to this
+    # worker's hub. Every worker runs its own tail, so a stream sees changes
+    # made by any worker within one interval. SQLite has one writer at a
+    # time, so ids become visible in order and a watermark never skips one.
+
+    def __init__(self, hub, batch_size=TAIL_BATCH_SIZE):
+        self.hub = hub
+        self.batch_size = batch_size
+        self.watermark = None
+        self.delivered = 0
+
+    def prime(self, cursor):
+        # Streams only carry what happens after the worker starts; the
+        # browser loads the current state itself when it connects.
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM notification_events")
+        self.watermark = cursor.fetchone()[0]
+
+    def poll(self, cursor):
+        if self.watermark is None:
+            self.prime(cursor)
+            return 0
+        delivered = 0
+        while True:
+            cursor.execute("""
+                SELECT id, user_id, notification_id FROM notification_events
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (self.watermark, self.batch_size))
+            events = cursor.fetchall()
+            if not events:
+                return delivered
+            self.watermark = events[-1]['id']
+            published = self._publish(cursor, events)
+            self.delivered += published
+            delivered += published
+            if len(events) < self.batch_size:
+                return delivered
+
+    def _publish(self, cursor, events):
+        # A user with a new or bumped row gets that row as it is now, which
+        # carries the unread count; anyone else with an event only gets the
+        # count.
+        events = [event for event in events if self.hub.has_subscribers(event['user_id'])]
+        if not events:
+            return 0
+        notification_ids = list({event['notification_id'] for event in events if event['notification_id']})
+
+        rows = []
+        if notification_ids:
+            cursor.execute(f"""
+                SELECT n.id, n.user_id, n.type, n.actor_id, n.actor_name, n.post_id, n.comment_id, n.message,
+                       n.read OR n.seq <= COALESCE(s.read_watermark, 0) AS read,
+                       n.created_at, n.actor_count
+                FROM notifications n
+                LEFT JOIN notification_state s ON s.user_id = n.user_id
+                WHERE n.id IN ({','.join('?' * len(notification_ids))})
+                  AND n.seq > COALESCE(s.cleared_watermark, 0)
+                ORDER BY n.seq
+            """, notification_ids)
+            rows = cursor.fetchall()
+        users = {event['user_id'] for event in events}
+        unread_only = users - {row['user_id'] for row in rows}
+        unread = {user_id: count_unread(cursor, user_id) for user_id in users}
+        for row in rows:
+            self.hub.publish(row['user_id'], 'notification', {
+                'notification': format_notification(row),
+                'unreadCount': unread[row['user_id']]
+            })
+        for user_id in unread_only:
+            self.hub.publish(user_id, 'unread', {'unreadCount': unread[user_id]})
+        return len(rows) + len(unread_only)
+
+
+tail = NotificationTail(hub)
+
+
+def poll_notification_events():
+    conn = get_db()
+    if not conn:
+        return None
+    try:
+        return {'delivered': tail.poll(conn.cursor()), 'watermark': tail.watermark}
+    finally:
+        conn.close()
+
+
+tail_task = PeriodicTask('notification-tail', TAIL_INTERVAL, poll_notification_events)
+
+
+def insert_notification(cursor, event):
+    # Grouped types upsert into one row per (recipient, type, target): the
+    # latest actor moves to the front of recent_actors, the row is marked
+    # unread and gets the user's next seq, which bumps it to the top. An
+    # actor still in the recent list is not counted twice, so unlike/like
+    # again does not inflate actorCount. A row hidden by "clear all" starts
+    # over as if it were new.
+    target_sql, action, group_by = NOTIFICATION_TYPES[event['type']]
+    group_key = f"(:type || ':' || {group_by})" if group_by else "NULL"
+    cleared = """notifications.seq <= COALESCE(
+        (SELECT cleared_watermark FROM notification_state WHERE user_id = notifications.user_id), 0
+    )"""
+    cursor.execute(f"""
+        INSERT INTO notifications (
+            user_id, type, actor_id, actor_name, post_id, comment_id, message, group_key, recent_actors, seq
+        )
+        SELECT t.owner_id, :type, :actor_id, a.name, t.post_id, :comment_id, a.name || ' ' || :action,
+               {group_key}, json_array(:actor_id),
+               COALESCE((SELECT last_seq FROM notification_state WHERE user_id = t.owner_id), 0) + 1
+        FROM ({target_sql}) t,
+             (SELECT COALESCE(:actor_name, (SELECT name FROM users WHERE id = :actor_id), 'Someone') AS name) a
+        WHERE t.owner_id != :actor_id
+        ON CONFLICT (user_id, group_key) DO UPDATE SET
+            actor_id = excluded.actor_id,
+            actor_name = excluded.actor_name,
+            message = excluded.message,
+            read = 0,
+            seq = excluded.seq,
+            created_at = CURRENT_TIMESTAMP,
+            actor_count = CASE WHEN {cleared} THEN 1 ELSE actor_count + (
+                excluded.actor_id NOT IN (SELECT value FROM json_each(notifications.recent_actors))
+            ) END,
+            recent_actors = CASE WHEN {cleared} THEN excluded.recent_actors ELSE (
+                SELECT json_group_array(actor_id) FROM (
+                    SELECT excluded.actor_id AS actor_id, -1 AS position
+                    UNION ALL
+                    SELECT value, key FROM json_each(notifications.recent_actors)
+                    WHERE value != excluded.actor_id
+                    ORDER BY position
+                    LIMIT {RECENT_ACTORS}
+                )
+            ) END
+        RETURNING {NOTIFICATION_COLUMNS}
+    """, {
+        'type': event['type'],
+        'actor_id': event['actor_id'],
+        'actor_name': event.get('actor_name'),
+        'post_id': event.get('post_id'),
+        'comment_id': event.get('comment_id'),
+        'poll_id': event.get('poll_id'),
+        'action': action
+    })
+    return cursor.fetchall()
+
+
+class NotificationDispatcher:
+    # Takes notification events off the request path. Routes call emit()
+    # after their own commit; a single thread writes whatever has queued up
+    # in one transaction, and the tails pick the rows up from there. If the
+    # thread is not running, or the queue is full, emit() writes inline so
+    # an event is never lost, only delayed.
+
+    def __init__(self, batch_size=DISPATCH_BATCH_SIZE, batch_window=DISPATCH_BATCH_WINDOW,
+                 queue_size=DISPATCH_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.emitted = 0
+        self.inserted = 0
+        self.batches = 0
+        self.inline = 0
+        self.failed = 0
+        self.skipped = 0
+        self.in_flight = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        # Wakes the thread with a sentinel; everything queued before it is
+        # still written before the thread exits.
+        if not self.running:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def emit(self, event_type, actor_id, **fields):
+        event = {'type': event_type, 'actor_id': actor_id, **fields}
+        with self._lock:
+            self.emitted += 1
+        item = (time.monotonic(), event)
+        if self.running:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                pass
+        with self._lock:
+            self.inline += 1
+            self.in_flight += 1
+        self._dispatch([item])
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            self._take(1)
+            stopping = False
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                self._take(1)
+            self._dispatch(batch)
+            if stopping:
+                break
+        # Anything emitted while stopping is still written.
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                remaining.append(item)
+        if remaining:
+            self._take(len(remaining))
+            self._dispatch(remaining)
+
+    def _take(self, count):
+        with self._lock:
+            self.in_flight += count
+
+    def _dispatch(self, batch):
+        rows = self._write(batch)
+        if rows is None:
+            with self._lock:
+                self.in_flight -= len(batch)
+                self.failed += len(batch)
+            return
+
+        lag = time.monotonic() - batch[0][0]
+        with self._lock:
+            self.in_flight -= len(batch)
+            self.batches += 1
+            self.inserted += len(rows)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def _write(self, batch):
+        # Retries only on OperationalError (locked/busy); any other error
+        # would fail the same way again. The batch is one transaction, so a
+        # retry starts from nothing rather than re-inserting earlier events.
+        for attempt in range(DISPATCH_RETRIES):
+            conn = get_db()
+            if not conn:
+                time.sleep(0.1 * (attempt + 1))
+                continue
+            try:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                rows = []
+                skipped = 0
+                for _, event in batch:
+                    # A savepoint per event keeps one bad event (say, an
+                    # actor deleted since it was emitted) from failing the
+                    # rest of the batch.
+                    cursor.execute("SAVEPOINT notification_event")
+                    try:
+                        rows.extend(insert_notification(cursor, event))
+                    except sqlite3.IntegrityError as err:
+                        print(f"Skipping notification event {event}: {err}")
+                        cursor.execute("ROLLBACK TO notification_event")
+                        skipped += 1
+                    cursor.execute("RELEASE notification_event")
+                conn.commit()
+                if skipped:
+                    with self._lock:
+                        self.skipped += skipped
+                return rows
+            except sqlite3.OperationalError as err:
+                print(f"Retrying notification batch: {err}")
+                conn.rollback()
+                time.sleep(0.1 * (attempt + 1))
+            except sqlite3.Error as err:
+                print(f"Error writing notification batch: {err}")
+                conn.rollback()
+                return None
+            finally:
+                conn.close()
+        return None
+
+    def stats(self):
+        with self._queue.mutex:
+            pending = [item for item in self._queue.queue if item is not None]
+        with self._lock:
+            return {
+                'running': self.running,
+                'depth': len(pending),
+                'inFlight': self.in_flight,
+                'oldestPendingMs': round((time.monotonic() - pending[0][0]) * 1000, 3) if pending else 0,
+                'lastLagMs': round(self.last_lag * 1000, 3) if self.last_lag is not None else None,
+                'maxLagMs': round(self.max_lag * 1000, 3),
+                'emitted': self.emitted,
+                'inserted': self.inserted,
+                'batches': self.batches,
+                'inline': self.inline,
+                'failed': self.failed,
+                'skipped': self.skipped
+            }
+
+
+dispatcher = NotificationDispatcher()
+
+
+def start_notification_dispatcher():
+    dispatcher.start()
+    if TAIL_INTERVAL > 0:
+        tail_task.run_once()
+        tail_task.start()
+    if COUNTER_CHECK_INTERVAL > 0:
+        counter_checker.start()
+    if COMPACT_INTERVAL > 0:
+        compactor.start()
@@ -1,38 +1,22 @@
-from flask import jsonify, request
+from flask import Response, jsonify, request, send_file
+import os
 import secrets
 import sqlite3
-from datetime import datetime
-from database import get_db
-
-
-def dict_from_row(row):
-    if row is None:
-        return None
-    return dict(zip(row.keys(), row))
-
-
-def format_time_ago(created_at):
-    if isinstance(created_at, str):
-        try:
-            created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-        except:
-            return created_at
-    
-    now = datetime.now()
-    diff = now - created_at
-    
-    seconds = diff.total_seconds()
-    if seconds < 60:
-        return 'Just now'
-    elif seconds < 3600:
-        mins = int(seconds / 60)
-        return f'{mins}m ago'
-    elif seconds < 86400:
-        hours = int(seconds / 3600)
-        return f'{hours}h ago'
-    else:
-        days = int(seconds / 86400)
-        return f'{days}d ago'
+from counters import counter_folder
+from database import checkpointer, get_db, get_pool, search_index_available
+from feed import (FEED_CURSOR_TYPES, feed_cache, fetch_post_page, hydrate_posts, load_feed_page,
+                  parse_page_args, poll_tally)
+from idempotency import idempotency_store
+from media import (MAX_MEDIA_BYTES, MEDIA_MAX_AGE, MEDIA_URL_PREFIX, UPLOAD_OVERHEAD_BYTES, MediaTooLarge,
+                   media_kind, media_path, receive_upload, resolve_post_media)
+import mutations
+from notifications import (clear_all, compactor, count_unread, counter_checker, dispatcher, hub,
+                           load_notifications, mark_all_read, tail_task)
+from search import (SEARCH_CURSOR_TYPES, SUGGEST_LIMIT, fetch_search_page, render_highlight,
+                    suggest_index, suggest_rebuilder)
+from templating import fragment_cache
+from thumbnails import media_pipeline, queue_media_variants
+from words import word_cache
 
 
 def register_routes(app):
@@ -41,6 +25,10 @@ def register_routes(app):
     def get_posts():
         user_id = request.args.get('userId', 'user-matt')
         word_id = request.args.get('wordId', type=int)
+        try:
+            after, limit = parse_page_args(request.args)
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
         conn = get_db()
         
         if not conn:
@@ -48,106 +36,7 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
-            
-            if word_id:
-                cursor.execute("""
-                    SELECT p.id, p.user_id as userId, p.text, p.likes_count as likes, 
-                           p.created_at, p.word_id,
-                           u.name as author, u.initials, u.age, u.type
-                    FROM posts p
-                    JOIN users u ON p.user_id = u.id
-                    WHERE p.word_id = ?
-                    ORDER BY p.likes_count DESC, p.created_at DESC
-                """, (word_id,))
-            else:
-                cursor.execute("""
-                    SELECT p.id, p.user_id as userId, p.text, p.likes_count as likes, 
-                           p.created_at, p.word_id,
-                           u.name as author, u.initials, u.age, u.type
-                    FROM posts p
-                    JOIN users u ON p.user_id = u.id
-                    ORDER BY p.likes_count DESC, p.created_at DESC
-                """)
-            posts = [dict_from_row(row) for row in cursor.fetchall()]
-            
-            result = []
-            for post in posts:
-                cursor.execute("SELECT media_type as type, url FROM post_media WHERE post_id = ?", (post['id'],))
-                media = [dict_from_row(row) for row in cursor.fetchall()]
-                
-                cursor.execute("""
-                    SELECT c.id, c.user_id as userId, c.text, c.created_at, c.likes_count,
-                           u.name as author, u.initials, u.type
-                    FROM comments c
-                    JOIN users u ON c.user_id = u.id
-                    WHERE c.post_id = ?
-                    ORDER BY c.likes_count DESC, c.created_at DESC
-                """, (post['id'],))
-                comments_raw = [dict_from_row(row) for row in cursor.fetchall()]
-                
-                comments_with_liked = []
-                for c in comments_raw:
-                    cursor.execute("SELECT 1 FROM comment_likes WHERE comment_id = ? AND user_id = ?", (c['id'], user_id))
-                    comment_liked = cursor.fetchone() is not None
-                    comments_with_liked.append({
-                        'id': c['id'],
-                        'userId': c['userId'],
-                        'author': c['author'],
-                        'initials': c['initials'],
-                        'type': c['type'],
-                        'text': c['text'],
-                        'likes': c['likes_count'],
-                        'liked': comment_liked,
-                        'time': format_time_ago(c['created_at'])
-                    })
-                
-                cursor.execute("SELECT 1 FROM likes WHERE post_id = ? AND user_id = ?", (post['id'], user_id))
-                liked = cursor.fetchone() is not None
-                
-                cursor.execute("SELECT id, question FROM polls WHERE post_id = ?", (post['id'],))
-                poll_row = cursor.fetchone()
-                poll_data = None
-                if poll_row:
-                    poll = dict_from_row(poll_row)
-                    cursor.execute("SELECT id, text, votes_count FROM poll_options WHERE poll_id = ? ORDER BY votes_count DESC", (poll['id'],))
-                    options = [dict_from_row(row) for row in cursor.fetchall()]
-                    
-                    cursor.execute("SELECT option_id FROM poll_votes WHERE poll_id = ? AND user_id = ?", (poll['id'], user_id))
-                    vote_row = cursor.fetchone()
-                    user_vote = vote_row[0] if vote_row else None
-                    
-                    total_votes = sum(opt['votes_count'] for opt in options)
-                    
-                    poll_data = {
-                        'id': poll['id'],
-                        'question': poll['question'],
-                        'options': [{
-                            'id': opt['id'],
-                            'text': opt['text'],
-                            'votes': opt['votes_count'],
-                            'percentage': round((opt['votes_count'] / total_votes * 100) if total_votes > 0 else 0)
-                        } for opt in options],
-                        'totalVotes': total_votes,
-                        'userVote': user_vote
-                    }
-                
-                result.append({
-                    'id': post['id'],
-                    'userId': post['userId'],
-                    'author': post['author'],
-                    'initials': post['initials'],
-                    'age': post['age'],
-                    'type': post['type'],
-                    'text': post['text'],
-                    'media': media,
-                    'likes': post['likes'],
-                    'liked': liked,
-                    'time': format_time_ago(post['created_at']),
-                    'comments': comments_with_liked,
-                    'poll': poll_data
-                })
-            
-            return jsonify(result)
+            return jsonify(load_feed_page(cursor, user_id, word_id, after, limit))
             
         except sqlite3.Error as err:
             print(f"Error getting posts: {err}")
@@ -158,6 +47,11 @@ def register_routes(app):
     @app.route('/api/posts', methods=['POST'])
     def create_post():
         data = request.json
+        try:
+            media_items = resolve_post_media(data.get('media', []))
+        except ValueError as err:
+            return jsonify({'error': f'Invalid media: {err}'}), 400
+
         conn = get_db()
         
         if not conn:
@@ -181,7 +75,7 @@ def register_routes(app):
                 (post_id, data['userId'], word_id, data.get('text', ''))
             )
             
-            for media in data.get('media', []):
+            for media in media_items:
                 cursor.execute(
                     "INSERT INTO post_media (post_id, media_type, url) VALUES (?, ?, ?)",
                     (post_id, media['type'], media['url'])
@@ -218,6 +112,8 @@ def register_routes(app):
                 }
             
             conn.commit()
+            feed_cache.invalidate()
+            suggest_index.add_post(data.get('text', ''), data['author'])
             
             return jsonify({
                 'id': post_id,
@@ -227,7 +123,7 @@ def register_routes(app):
                 'age': data['age'],
                 'type': data['type'],
                 'text': data.get('text', ''),
-                'media': data.get('media', []),
+                'media': media_items,
                 'likes': 0,
                 'liked': False,
                 'time': 'Just now',
@@ -244,6 +140,11 @@ def register_routes(app):
     @app.route('/api/posts/<post_id>', methods=['PUT'])
     def update_post(post_id):
         data = request.json
+        try:
+            media_items = resolve_post_media(data.get('media', []))
+        except ValueError as err:
+            return jsonify({'error': f'Invalid media: {err}'}), 400
+
         conn = get_db()
         
         if not conn:
@@ -251,6 +152,8 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
+            cursor.execute("SELECT text FROM posts WHERE id = ?", (post_id,))
+            previous = cursor.fetchone()
             
             cursor.execute(
                 "UPDATE posts SET text = ? WHERE id = ?",
@@ -258,14 +161,18 @@ def register_routes(app):
             )
             
             cursor.execute("DELETE FROM post_media WHERE post_id = ?", (post_id,))
-            for media in data.get('media', []):
+            for media in media_items:
                 cursor.execute(
                     "INSERT INTO post_media (post_id, media_type, url) VALUES (?, ?, ?)",
                     (post_id, media['type'], media['url'])
                 )
             
             conn.commit()
-            return jsonify({'success': True})
+            feed_cache.invalidate()
+            if previous:
+                suggest_index.remove_post(previous['text'])
+                suggest_index.add_post(data.get('text', ''))
+            return jsonify({'success': True, 'media': media_items})
             
         except sqlite3.Error as err:
             print(f"Error updating post: {err}")
@@ -282,8 +189,15 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
+            cursor.execute("""
+                SELECT p.text, u.name FROM posts p JOIN users u ON p.user_id = u.id WHERE p.id = ?
+            """, (post_id,))
+            deleted = cursor.fetchone()
             cursor.execute("DELETE FROM posts WHERE id = ?", (post_id,))
             conn.commit()
+            feed_cache.invalidate()
+            if deleted:
+                suggest_index.remove_post(deleted['text'], deleted['name'])
             return jsonify({'success': True})
             
         except sqlite3.Error as err:
@@ -302,36 +216,10 @@ def register_routes(app):
             return jsonify({'error': 'Database connection failed'}), 500
         
         try:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT 1 FROM likes WHERE post_id = ? AND user_id = ?", (post_id, user_id))
-            already_liked = cursor.fetchone() is not None
-            
-            if already_liked:
-                cursor.execute("DELETE FROM likes WHERE post_id = ? AND user_id = ?", (post_id, user_id))
-                cursor.execute("UPDATE posts SET likes_count = likes_count - 1 WHERE id = ?", (post_id,))
-                liked = False
-            else:
-                cursor.execute("INSERT INTO likes (post_id, user_id) VALUES (?, ?)", (post_id, user_id))
-                cursor.execute("UPDATE posts SET likes_count = likes_count + 1 WHERE id = ?", (post_id,))
-                liked = True
-                
-                cursor.execute("SELECT user_id FROM posts WHERE id = ?", (post_id,))
-                post_owner = cursor.fetchone()
-                if post_owner and post_owner[0] != user_id:
-                    cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
-                    actor = cursor.fetchone()
-                    actor_name = actor[0] if actor else 'Someone'
-                    cursor.execute(
-                        "INSERT INTO notifications (user_id, type, actor_id, actor_name, post_id, message) VALUES (?, ?, ?, ?, ?, ?)",
-                        (post_owner[0], 'post_like', user_id, actor_name, post_id, f'{actor_name} liked your post')
-                    )
-            
-            conn.commit()
-            
-            cursor.execute("SELECT likes_count FROM posts WHERE id = ?", (post_id,))
-            result = cursor.fetchone()
-            likes = result[0] if result else 0
+            likes, liked = mutations.toggle_post_like(conn, post_id, user_id)
+            feed_cache.invalidate()
+            if liked:
+                dispatcher.emit('post_like', user_id, post_id=post_id)
             
             return jsonify({'likes': likes, 'liked': liked})
             
@@ -350,43 +238,11 @@ def register_routes(app):
             return jsonify({'error': 'Database connection failed'}), 500
         
         try:
-            cursor = conn.cursor()
+            comment = mutations.add_comment(conn, post_id, data)
+            feed_cache.invalidate()
+            dispatcher.emit('comment', data['userId'], actor_name=data['author'], post_id=post_id, comment_id=comment['id'])
             
-            cursor.execute("SELECT 1 FROM users WHERE id = ?", (data['userId'],))
-            if not cursor.fetchone():
-                cursor.execute(
-                    "INSERT INTO users (id, name, initials, age, type) VALUES (?, ?, ?, ?, ?)",
-                    (data['userId'], data['author'], data['initials'], data.get('age', 18), data['type'])
-                )
-            
-            comment_id = f"c-{secrets.token_hex(4)}"
-            
-            cursor.execute(
-                "INSERT INTO comments (id, post_id, user_id, text) VALUES (?, ?, ?, ?)",
-                (comment_id, post_id, data['userId'], data['text'])
-            )
-            
-            cursor.execute("SELECT user_id FROM posts WHERE id = ?", (post_id,))
-            post_owner = cursor.fetchone()
-            if post_owner and post_owner[0] != data['userId']:
-                cursor.execute(
-                    "INSERT INTO notifications (user_id, type, actor_id, actor_name, post_id, comment_id, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (post_owner[0], 'comment', data['userId'], data['author'], post_id, comment_id, f"{data['author']} commented on your post")
-                )
-            
-            conn.commit()
-            
-            return jsonify({
-                'id': comment_id,
-                'userId': data['userId'],
-                'author': data['author'],
-                'initials': data['initials'],
-                'type': data['type'],
-                'text': data['text'],
-                'likes': 0,
-                'liked': False,
-                'time': 'Just now'
-            }), 201
+            return jsonify(comment), 201
             
         except sqlite3.Error as err:
             print(f"Error adding comment: {err}")
@@ -409,6 +265,7 @@ def register_routes(app):
                 (data.get('text', ''), comment_id, post_id)
             )
             conn.commit()
+            feed_cache.invalidate()
             return jsonify({'success': True})
             
         except sqlite3.Error as err:
@@ -428,6 +285,7 @@ def register_routes(app):
             cursor = conn.cursor()
             cursor.execute("DELETE FROM comments WHERE id = ? AND post_id = ?", (comment_id, post_id))
             conn.commit()
+            feed_cache.invalidate()
             return jsonify({'success': True})
             
         except sqlite3.Error as err:
@@ -446,36 +304,10 @@ def register_routes(app):
             return jsonify({'error': 'Database connection failed'}), 500
         
         try:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT 1 FROM comment_likes WHERE comment_id = ? AND user_id = ?", (comment_id, user_id))
-            already_liked = cursor.fetchone() is not None
-            
-            if already_liked:
-                cursor.execute("DELETE FROM comment_likes WHERE comment_id = ? AND user_id = ?", (comment_id, user_id))
-                cursor.execute("UPDATE comments SET likes_count = likes_count - 1 WHERE id = ?", (comment_id,))
-                liked = False
-            else:
-                cursor.execute("INSERT INTO comment_likes (comment_id, user_id) VALUES (?, ?)", (comment_id, user_id))
-                cursor.execute("UPDATE comments SET likes_count = likes_count + 1 WHERE id = ?", (comment_id,))
-                liked = True
-                
-                cursor.execute("SELECT user_id FROM comments WHERE id = ?", (comment_id,))
-                comment_owner = cursor.fetchone()
-                if comment_owner and comment_owner[0] != user_id:
-                    cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
-                    actor = cursor.fetchone()
-                    actor_name = actor[0] if actor else 'Someone'
-                    cursor.execute(
-                        "INSERT INTO notifications (user_id, type, actor_id, actor_name, post_id, comment_id, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (comment_owner[0], 'comment_like', user_id, actor_name, post_id, comment_id, f'{actor_name} liked your comment')
-                    )
-            
-            conn.commit()
-            
-            cursor.execute("SELECT likes_count FROM comments WHERE id = ?", (comment_id,))
-            result = cursor.fetchone()
-            likes = result[0] if result else 0
+            likes, liked = mutations.toggle_comment_like(conn, comment_id, user_id)
+            feed_cache.invalidate()
+            if liked:
+                dispatcher.emit('comment_like', user_id, post_id=post_id, comment_id=comment_id)
             
             return jsonify({'likes': likes, 'liked': liked})
             
@@ -496,69 +328,95 @@ def register_routes(app):
             return jsonify({'error': 'Database connection failed'}), 500
         
         try:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT option_id FROM poll_votes WHERE poll_id = ? AND user_id = ?", (poll_id, user_id))
-            existing_vote = cursor.fetchone()
-            
-            is_new_vote = existing_vote is None
-            
-            if existing_vote:
-                old_option_id = existing_vote[0]
-                if old_option_id == option_id:
-                    return jsonify({'error': 'Already voted for this option'}), 400
-                cursor.execute("UPDATE poll_options SET votes_count = votes_count - 1 WHERE id = ?", (old_option_id,))
-                cursor.execute("UPDATE poll_votes SET option_id = ? WHERE poll_id = ? AND user_id = ?", (option_id, poll_id, user_id))
-            else:
-                cursor.execute("INSERT INTO poll_votes (poll_id, option_id, user_id) VALUES (?, ?, ?)", (poll_id, option_id, user_id))
-            
-            cursor.execute("UPDATE poll_options SET votes_count = votes_count + 1 WHERE id = ?", (option_id,))
-            
+            poll_data, is_new_vote = mutations.cast_poll_vote(conn, poll_id, option_id, user_id)
+            feed_cache.invalidate()
             if is_new_vote:
-                cursor.execute("""
-                    SELECT p.user_id, pl.question 
-                    FROM polls pl 
-                    JOIN posts p ON pl.post_id = p.id 
-                    WHERE pl.id = ?
-                """, (poll_id,))
-                poll_info = cursor.fetchone()
-                if poll_info and poll_info[0] != user_id:
-                    post_owner_id = poll_info[0]
-                    poll_question = poll_info[1]
-                    cursor.execute("SELECT name FROM users WHERE id = ?", (user_id,))
-                    actor = cursor.fetchone()
-                    actor_name = actor[0] if actor else 'Someone'
-                    cursor.execute("SELECT post_id FROM polls WHERE id = ?", (poll_id,))
-                    post_row = cursor.fetchone()
-                    post_id = post_row[0] if post_row else None
-                    cursor.execute(
-                        "INSERT INTO notifications (user_id, type, actor_id, actor_name, post_id, message) VALUES (?, ?, ?, ?, ?, ?)",
-                        (post_owner_id, 'poll_vote', user_id, actor_name, post_id, f'{actor_name} voted on your poll')
-                    )
-            
-            conn.commit()
-            
-            cursor.execute("SELECT id, text, votes_count FROM poll_options WHERE poll_id = ? ORDER BY votes_count DESC", (poll_id,))
-            options = [dict_from_row(row) for row in cursor.fetchall()]
-            total_votes = sum(opt['votes_count'] for opt in options)
+                dispatcher.emit('poll_vote', user_id, poll_id=poll_id)
             
             return jsonify({
-                'options': [{
-                    'id': opt['id'],
-                    'text': opt['text'],
-                    'votes': opt['votes_count'],
-                    'percentage': round((opt['votes_count'] / total_votes * 100) if total_votes > 0 else 0)
-                } for opt in options],
-                'totalVotes': total_votes,
-                'userVote': option_id
+                'options': poll_data['options'],
+                'totalVotes': poll_data['totalVotes'],
+                'userVote': poll_data['userVote']
             })
             
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
         except sqlite3.Error as err:
             print(f"Error voting on poll: {err}")
             return jsonify({'error': str(err)}), 500
         finally:
             conn.close()
 
+    @app.route('/api/interactions/batch', methods=['POST'])
+    def apply_interaction_batch():
+        data = request.json or {}
+        user_id = data.get('userId', 'user-matt')
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations or not all(isinstance(op, dict) for op in operations):
+            return jsonify({'error': 'operations must be a non-empty list of objects'}), 400
+        if len(operations) > mutations.MAX_BATCH_OPERATIONS:
+            return jsonify({'error': f'At most {mutations.MAX_BATCH_OPERATIONS} operations per batch'}), 400
+        conn = get_db()
+        
+        if not conn:
+            return jsonify({'error': 'Database connection failed'}), 500
+        
+        try:
+            results, notifications = mutations.apply_interactions(conn, user_id, operations)
+            if any(result['ok'] and not result.get('replayed') for result in results):
+                feed_cache.invalidate()
+            for event_type, fields in notifications:
+                dispatcher.emit(event_type, user_id, **fields)
+            
+            return jsonify({'results': results})
+            
+        except sqlite3.Error as err:
+            print(f"Error applying interaction batch: {err}")
+            return jsonify({'error': str(err)}), 500
+        finally:
+            conn.close()
+
+    @app.route('/api/media', methods=['POST'])
+    def upload_media():
+        # The body is streamed to disk part by part rather than parsed by
+        # request.files, and an oversized upload is refused from its
+        # Content-Length before anything is read.
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return jsonify({'error': 'Expected a multipart/form-data upload'}), 400
+        limit = MAX_MEDIA_BYTES + UPLOAD_OVERHEAD_BYTES
+        if request.content_length is not None and request.content_length > limit:
+            return jsonify({'error': f'Media exceeds {MAX_MEDIA_BYTES // (1024 * 1024)} MB'}), 413
+        request.max_content_length = limit
+
+        try:
+            url = receive_upload(request.stream, boundary)
+        except MediaTooLarge as err:
+            return jsonify({'error': str(err)}), 413
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
+        except OSError as err:
+            print(f"Error storing upload: {err}")
+            return jsonify({'error': 'Could not store media'}), 500
+
+        name = url[len(MEDIA_URL_PREFIX):]
+        item = {'id': name, 'type': media_kind(name), 'url': url}
+        queue_media_variants([item])
+        return jsonify(item), 201
+
+    @app.route('/media/<name>', methods=['GET'])
+    def get_media(name):
+        # Names are content hashes, so a response never changes: clients and
+        # proxies may cache it for a year without revalidating. send_file
+        # answers Range and conditional requests and hands the file to the
+        # server's sendfile support where available.
+        path = media_path(name)
+        if not path or not os.path.isfile(path):
+            return jsonify({'error': 'Media not found'}), 404
+        response = send_file(path, conditional=True, etag=name.split('.')[0], max_age=MEDIA_MAX_AGE)
+        response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+        return response
+
     @app.route('/api/posts/search', methods=['GET'])
     def search_posts():
         query = request.args.get('q', '').strip()
@@ -566,7 +424,13 @@ def register_routes(app):
         word_id = request.args.get('wordId', type=int)
         
         if not query or len(query) < 2:
-            return jsonify([])
+            return jsonify({'posts': [], 'nextCursor': None})
+        
+        use_index = search_index_available()
+        try:
+            after, limit = parse_page_args(request.args, SEARCH_CURSOR_TYPES if use_index else FEED_CURSOR_TYPES)
+        except ValueError as err:
+            return jsonify({'error': str(err)}), 400
         
         conn = get_db()
         if not conn:
@@ -574,105 +438,22 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
-            search_pattern = f"%{query}%"
-            
-            if word_id:
-                cursor.execute("""
-                    SELECT p.id, p.user_id as userId, p.text, p.likes_count as likes, 
-                           p.created_at, p.word_id,
-                           u.name as author, u.initials, u.age, u.type
-                    FROM posts p
-                    JOIN users u ON p.user_id = u.id
-                    WHERE p.text LIKE ? AND p.word_id = ?
-                    ORDER BY p.likes_count DESC, p.created_at DESC
-                """, (search_pattern, word_id))
+            
+            if use_index:
+                posts, next_cursor = fetch_search_page(cursor, query, word_id, after, limit)
             else:
-                cursor.execute("""
-                    SELECT p.id, p.user_id as userId, p.text, p.likes_count as likes, 
-                           p.created_at, p.word_id,
-                           u.name as author, u.initials, u.age, u.type
-                    FROM posts p
-                    JOIN users u ON p.user_id = u.id
-                    WHERE p.text LIKE ?
-                    ORDER BY p.likes_count DESC, p.created_at DESC
-                """, (search_pattern,))
-            posts_data = [dict_from_row(row) for row in cursor.fetchall()]
-            
-            result = []
-            for post in posts_data:
-                cursor.execute("SELECT media_type as type, url FROM post_media WHERE post_id = ?", (post['id'],))
-                media = [dict_from_row(row) for row in cursor.fetchall()]
-                
-                cursor.execute("""
-                    SELECT c.id, c.user_id as userId, c.text, c.created_at, c.likes_count,
-                           u.name as author, u.initials, u.type
-                    FROM comments c
-                    JOIN users u ON c.user_id = u.id
-                    WHERE c.post_id = ?
-                    ORDER BY c.likes_count DESC, c.created_at DESC
-                """, (post['id'],))
-                comments_raw = [dict_from_row(row) for row in cursor.fetchall()]
-                
-                comments_with_liked = []
-                for c in comments_raw:
-                    cursor.execute("SELECT 1 FROM comment_likes WHERE comment_id = ? AND user_id = ?", (c['id'], user_id))
-                    comment_liked = cursor.fetchone() is not None
-                    comments_with_liked.append({
-                        'id': c['id'],
-                        'userId': c['userId'],
-                        'author': c['author'],
-                        'initials': c['initials'],
-                        'type': c['type'],
-                        'text': c['text'],
-                        'likes': c['likes_count'],
-                        'liked': comment_liked,
-                        'time': format_time_ago(c['created_at'])
-                    })
-                
-                cursor.execute("SELECT 1 FROM likes WHERE post_id = ? AND user_id = ?", (post['id'], user_id))
-                liked = cursor.fetchone() is not None
-                
-                cursor.execute("SELECT id, question FROM polls WHERE post_id = ?", (post['id'],))
-                poll_row = cursor.fetchone()
-                poll_data = None
-                if poll_row:
-                    poll = dict_from_row(poll_row)
-                    cursor.execute("SELECT id, text, votes_count FROM poll_options WHERE poll_id = ? ORDER BY votes_count DESC", (poll['id'],))
-                    options = [dict_from_row(row) for row in cursor.fetchall()]
-                    cursor.execute("SELECT option_id FROM poll_votes WHERE poll_id = ? AND user_id = ?", (poll['id'], user_id))
-                    vote_row = cursor.fetchone()
-                    user_vote = vote_row[0] if vote_row else None
-                    total_votes = sum(opt['votes_count'] for opt in options)
-                    poll_data = {
-                        'id': poll['id'],
-                        'question': poll['question'],
-                        'options': [{
-                            'id': opt['id'],
-                            'text': opt['text'],
-                            'votes': opt['votes_count'],
-                            'percentage': round((opt['votes_count'] / total_votes * 100) if total_votes > 0 else 0)
-                        } for opt in options],
-                        'totalVotes': total_votes,
-                        'userVote': user_vote
-                    }
-                
-                result.append({
-                    'id': post['id'],
-                    'userId': post['userId'],
-                    'author': post['author'],
-                    'initials': post['initials'],
-                    'age': post['age'],
-                    'type': post['type'],
-                    'text': post['text'],
-                    'media': media,
-                    'likes': post['likes'],
-                    'liked': liked,
-                    'time': format_time_ago(post['created_at']),
-                    'comments': comments_with_liked,
-                    'poll': poll_data
-                })
-            
-            return jsonify(result)
+                search_pattern = f"%{query}%"
+                posts, next_cursor = fetch_post_page(cursor, word_id, after, limit, search_pattern)
+            
+            result = hydrate_posts(cursor, posts, user_id)
+            if use_index:
+                for post, row in zip(result, posts):
+                    post['highlight'] = render_highlight(row['highlighted'])
+            
+            return jsonify({
+                'posts': result,
+                'nextCursor': next_cursor
+            })
             
         except sqlite3.Error as err:
             print(f"Error searching posts: {err}")
@@ -680,6 +461,12 @@ def register_routes(app):
         finally:
             conn.close()
 
+    @app.route('/api/search/suggest', methods=['GET'])
+    def suggest_search_terms():
+        prefix = request.args.get('q', '').strip()
+        limit = max(1, min(request.args.get('limit', SUGGEST_LIMIT, type=int), SUGGEST_LIMIT))
+        return jsonify({'suggestions': suggest_index.suggest(prefix, limit)})
+
     @app.route('/api/notifications', methods=['GET'])
     def get_notifications():
         user_id = request.args.get('userId', 'user-matt')
@@ -691,30 +478,8 @@ def register_routes(app):
         try:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT id, type, actor_id, actor_name, post_id, comment_id, message, read, created_at
-                FROM notifications
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT 20
-            """, (user_id,))
-            
-            notifications = []
-            for row in cursor.fetchall():
-                notifications.append({
-                    'id': row[0],
-                    'type': row[1],
-                    'actorId': row[2],
-                    'actorName': row[3],
-                    'postId': row[4],
-                    'commentId': row[5],
-                    'message': row[6],
-                    'read': bool(row[7]),
-                    'time': format_time_ago(row[8])
-                })
-            
-            cursor.execute("SELECT COUNT(*) FROM notifications WHERE user_id = ? AND read = 0", (user_id,))
-            unread_count = cursor.fetchone()[0]
+            notifications = load_notifications(cursor, user_id)
+            unread_count = count_unread(cursor, user_id)
             
             return jsonify({
                 'notifications': notifications,
@@ -727,6 +492,14 @@ def register_routes(app):
         finally:
             conn.close()
 
+    @app.route('/api/notifications/stream', methods=['GET'])
+    def stream_notifications():
+        user_id = request.args.get('userId', 'user-matt')
+        return Response(hub.stream(user_id), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
     @app.route('/api/notifications/<int:notification_id>/read', methods=['POST'])
     def mark_notification_read(notification_id):
         conn = get_db()
@@ -757,7 +530,7 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
-            cursor.execute("UPDATE notifications SET read = 1 WHERE user_id = ?", (user_id,))
+            mark_all_read(cursor, user_id)
             conn.commit()
             return jsonify({'success': True})
             
@@ -778,7 +551,7 @@ def register_routes(app):
         
         try:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
+            clear_all(cursor, user_id)
             conn.commit()
             return jsonify({'success': True})
             
@@ -786,4 +559,25 @@ def register_routes(app):
             print(f"Error clearing all notifications: {err}")
             return jsonify({'error': str(err)}), 500
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+    @app.route('/api/stats', methods=['GET'])
+    def get_stats():
+        return jsonify({
+            'feedCache': feed_cache.stats(),
+            'dbPool': get_pool().stats(),
+            'checkpointer': checkpointer.stats(),
+            'notificationHub': hub.stats(),
+            'notificationTail': tail_task.stats(),
+            'notificationDispatcher': dispatcher.stats(),
+            'notificationCounterCheck': counter_checker.stats(),
+            'notificationCompactor': compactor.stats(),
+            'writeBatcher': mutations.write_batcher.stats(),
+            'counterFolder': counter_folder.stats(),
+            'suggestRebuilder': suggest_rebuilder.stats(),
+            'pollTally': poll_tally.stats(),
+            'idempotency': idempotency_store.stats(),
+            'mediaPipeline': media_pipeline.stats(),
+            'wordCache': word_cache.stats(),
+            'fragmentCache': fragment_cache.stats()
+        })
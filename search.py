@@ -0,0 +1,258 @@
+import os
+import re
+import sqlite3
+import threading
+from html import escape
+
+from background import PeriodicTask
+from database import get_db
+from feed import DEFAULT_PAGE_SIZE, POST_COLUMNS, dict_from_row, encode_cursor
+
+# Sort key layout of the full-text search cursor: (bm25 score, post id).
+SEARCH_CURSOR_TYPES = ((int, float), str)
+
+# bm25 column weights for post_text, comment_text and word_text: a hit in the
+# post itself outranks one in its comments, which outranks the word blurb.
+BM25_WEIGHTS = (10.0, 4.0, 1.0)
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def build_match_query(query):
+    # User input is reduced to quoted terms so FTS5 operators and syntax
+    # errors can't leak through; the last term is a prefix match so partial
+    # words still find something.
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def render_highlight(text):
+    marked = escape(text or '')
+    return marked.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def fetch_search_page(cursor, query, word_id=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    match = build_match_query(query)
+    if not match:
+        return [], None
+
+    conditions = []
+    params = [match]
+    if word_id:
+        conditions.append("p.word_id = ?")
+        params.append(word_id)
+    if after:
+        conditions.append("(f.score, p.id) > (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor.execute(f"""
+        SELECT {POST_COLUMNS}, f.score, f.highlighted
+        FROM (
+            SELECT rowid,
+                   bm25(posts_fts, ?, ?, ?) AS score,
+                   highlight(posts_fts, 0, ?, ?) AS highlighted
+            FROM posts_fts
+            WHERE posts_fts MATCH ?
+        ) f
+        JOIN posts p ON p.rowid = f.rowid
+        JOIN users u ON p.user_id = u.id
+        {where}
+        ORDER BY f.score, p.id
+        LIMIT ?
+    """, (*BM25_WEIGHTS, HIGHLIGHT_START, HIGHLIGHT_END, *params, limit + 1))
+    posts = [dict_from_row(row) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor((posts[-1]['score'], posts[-1]['id']))
+    return posts, next_cursor
+
+
+SUGGEST_LIMIT = 8
+SUGGEST_POST_SAMPLE = 5000
+# Edits and deletes adjust this worker's index in place; a periodic rebuild
+# picks up what other workers changed and what fell out of the sample.
+SUGGEST_REBUILD_INTERVAL = float(os.environ.get('BRIDGEGEN_SUGGEST_REBUILD_INTERVAL', 900))
+
+# Vocabulary entries and author names are boosted over plain post terms so a
+# prefix like "shi" offers "Shiok" before words that merely appear often.
+SUGGEST_BOOST = {'word': 1000, 'author': 100, 'term': 0}
+
+STOPWORDS = {
+    'the', 'and', 'for', 'that', 'this', 'with', 'was', 'you', 'are', 'have',
+    'but', 'not', 'all', 'can', 'just', 'what', 'when', 'one', 'our', 'they',
+    'she', 'his', 'her', 'him', 'from', 'there', 'their', 'then', 'than', 'too',
+    'also', 'got', 'who', 'how', 'why', 'out', 'now', 'very', 'your', 'its',
+    'had', 'has', 'been', 'were', 'will', 'into', 'about', 'after', 'still'
+}
+
+
+def extract_terms(text):
+    return [term for term in re.findall(r"[^\W\d_]{3,}", (text or '').lower()) if term not in STOPWORDS]
+
+
+class _TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []
+
+
+class PrefixIndex:
+    # Each trie node keeps its best completions, so a lookup is a walk down
+    # the prefix plus a copy of one short list. Adding to a term can only
+    # promote it along its path; taking from one rebuilds the lists on that
+    # path from the children's lists, which still hold their subtrees' best.
+
+    def __init__(self, max_suggestions=SUGGEST_LIMIT):
+        self.max_suggestions = max_suggestions
+        self._root = _TrieNode()
+        self._terms = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, text, kind='term', weight=1):
+        key = ' '.join(text.lower().split())
+        if not key:
+            return
+        with self._lock:
+            entry = self._terms.get(key)
+            if entry is None:
+                entry = self._terms[key] = {'text': text, 'kind': kind, 'count': 0, 'weight': SUGGEST_BOOST[kind]}
+            elif SUGGEST_BOOST[kind] > SUGGEST_BOOST[entry['kind']]:
+                entry['weight'] += SUGGEST_BOOST[kind] - SUGGEST_BOOST[entry['kind']]
+                entry['text'] = text
+                entry['kind'] = kind
+            entry['count'] += weight
+            entry['weight'] += weight
+
+            node = self._root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                self._promote(node, key)
+
+    def remove(self, text, weight=1):
+        # Vocabulary words stay even when nothing uses them; other terms are
+        # dropped once no indexed post mentions them.
+        key = ' '.join(text.lower().split())
+        with self._lock:
+            entry = self._terms.get(key)
+            if entry is None:
+                return
+            entry['count'] -= weight
+            entry['weight'] -= weight
+            if entry['count'] <= 0 and entry['kind'] != 'word':
+                del self._terms[key]
+
+            path = [self._root]
+            for char in key:
+                path.append(path[-1].children[char])
+            for depth in range(len(key), 0, -1):
+                node = path[depth]
+                prefix = key[:depth]
+                if not node.children and prefix not in self._terms:
+                    del path[depth - 1].children[key[depth - 1]]
+                    continue
+                self._rebuild_top(node, prefix)
+
+    def _promote(self, node, key):
+        top = node.top
+        if key not in top:
+            if len(top) >= self.max_suggestions and self._terms[top[-1]]['weight'] >= self._terms[key]['weight']:
+                return
+            top.append(key)
+        top.sort(key=lambda k: -self._terms[k]['weight'])
+        del top[self.max_suggestions:]
+
+    def _rebuild_top(self, node, prefix):
+        candidates = [prefix] if prefix in self._terms else []
+        for child in node.children.values():
+            candidates.extend(child.top)
+        candidates.sort(key=lambda k: -self._terms[k]['weight'])
+        node.top = candidates[:self.max_suggestions]
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        key = ' '.join(prefix.lower().split())
+        if not key:
+            return []
+        with self._lock:
+            node = self._root
+            for char in key:
+                node = node.children.get(char)
+                if node is None:
+                    return []
+            return [{'text': self._terms[k]['text'], 'kind': self._terms[k]['kind']} for k in node.top[:limit]]
+
+    def replace_with(self, other):
+        with self._lock:
+            self._root = other._root
+            self._terms = other._terms
+
+    def add_post(self, text, author=None):
+        for term in extract_terms(text):
+            self.add(term)
+        if author:
+            self.add(author, 'author')
+
+    def remove_post(self, text, author=None):
+        for term in extract_terms(text):
+            self.remove(term)
+        if author:
+            self.remove(author)
+
+
+suggest_index = PrefixIndex()
+
+
+def build_suggest_index(conn):
+    index = PrefixIndex()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT word FROM word_of_day")
+    for row in cursor.fetchall():
+        index.add(row[0], 'word')
+
+    # Authors are weighted by post count, matching what add_post and
+    # remove_post do as posts come and go.
+    cursor.execute("SELECT u.name, COUNT(*) FROM users u JOIN posts p ON p.user_id = u.id GROUP BY u.id")
+    for row in cursor.fetchall():
+        index.add(row[0], 'author', row[1])
+
+    cursor.execute("SELECT text FROM posts ORDER BY created_at DESC LIMIT ?", (SUGGEST_POST_SAMPLE,))
+    for row in cursor.fetchall():
+        for term in extract_terms(row[0]):
+            index.add(term)
+
+    return index
+
+
+def load_suggest_index():
+    conn = get_db()
+    if not conn:
+        return
+
+    try:
+        suggest_index.replace_with(build_suggest_index(conn))
+        return {'terms': len(suggest_index)}
+    except sqlite3.Error as err:
+        print(f"Error building suggestion index: {err}")
+    finally:
+        conn.close()
+
+
+suggest_rebuilder = PeriodicTask('suggest-index-rebuild', SUGGEST_REBUILD_INTERVAL, load_suggest_index)
+
+
+def start_suggest_rebuilder():
+    if SUGGEST_REBUILD_INTERVAL > 0:
+        suggest_rebuilder.start()
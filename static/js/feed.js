@@ -28,26 +28,134 @@ let createMediaFiles = [];
 let editMediaFiles = [];
 let isSearching = false;
 let searchTimeout = null;
+let suggestTimeout = null;
+let currentQuery = '';
+let nextCursor = null;
+let searchCursor = null;
+let isLoadingMore = false;
+let notifications = [];
+let outbox = new Map();
+let outboxTimer = null;
+let outboxRetryMs = 0;
+let writeKeys = new Map();
+
+const PAGE_SIZE = 20;
+const SEARCH_DEBOUNCE_MS = 600;
+const SUGGEST_DEBOUNCE_MS = 80;
+const NOTIFICATION_POLL_MS = 30000;
+const OUTBOX_DELAY_MS = 400;
+const OUTBOX_MAX_RETRY_MS = 30000;
 
 document.addEventListener('DOMContentLoaded', () => {
-    fetchPosts();
-    fetchNotifications();
+    if (!hydrateInitialFeed()) {
+        fetchPosts();
+    }
+    connectNotificationStream();
     setupFilterButtons();
     setupModalCloseOnOutsideClick();
+    setupInfiniteScroll();
 });
 
+window.addEventListener('pagehide', flushOutboxOnExit);
+
+// The page ships with its first feed page embedded as JSON, so the feed can
+// render without waiting for a round trip to /api/posts.
+function hydrateInitialFeed() {
+    const island = document.getElementById('initialFeed');
+    if (!island) return false;
+
+    const data = JSON.parse(island.textContent);
+    island.remove();
+    posts = data.posts;
+    allPosts = [...posts];
+    nextCursor = data.nextCursor;
+    renderPosts();
+    maybeLoadMore();
+    return true;
+}
+
 async function fetchPosts() {
     try {
-        const response = await fetch(`/api/posts?userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}`);
-        posts = await response.json();
+        const response = await fetch(`/api/posts?userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}&limit=${PAGE_SIZE}`);
+        const data = await response.json();
+        posts = data.posts;
         allPosts = [...posts];
+        nextCursor = data.nextCursor;
         renderPosts();
+        maybeLoadMore();
     } catch (error) {
         console.error('Error fetching posts:', error);
         showToast('Error loading posts');
     }
 }
 
+function setupInfiniteScroll() {
+    const sentinel = document.getElementById('feedSentinel');
+    if (!sentinel || !('IntersectionObserver' in window)) return;
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMorePosts();
+        }
+    }, { rootMargin: '600px 0px' });
+    observer.observe(sentinel);
+}
+
+function maybeLoadMore() {
+    // The observer only fires on changes, so a short page that leaves the
+    // sentinel on screen has to ask for the next page itself.
+    const sentinel = document.getElementById('feedSentinel');
+    if (sentinel && sentinel.getBoundingClientRect().top < window.innerHeight + 600) {
+        loadMorePosts();
+    }
+}
+
+function appendUniquePosts(target, incoming) {
+    // A post whose likes changed between pages can show up twice.
+    const seen = new Set(target.map(p => p.id));
+    const added = incoming.filter(p => !seen.has(p.id));
+    target.push(...added);
+    return added;
+}
+
+async function loadMorePosts() {
+    const cursor = isSearching ? searchCursor : nextCursor;
+    if (!cursor || isLoadingMore) return;
+
+    const searching = isSearching;
+    const query = currentQuery;
+    const url = searching
+        ? `/api/posts/search?q=${encodeURIComponent(query)}&userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}&limit=${PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`
+        : `/api/posts?userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}&limit=${PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`;
+
+    isLoadingMore = true;
+    try {
+        const response = await fetch(url);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Error loading posts');
+        }
+        if (searching !== isSearching || query !== currentQuery) return;
+
+        const added = appendUniquePosts(posts, data.posts);
+        if (searching) {
+            searchCursor = data.nextCursor;
+            updateSearchHeader();
+        } else {
+            allPosts.push(...added);
+            nextCursor = data.nextCursor;
+        }
+        renderPosts();
+    } catch (error) {
+        console.error('Error loading more posts:', error);
+        showToast('Error loading posts');
+        return;
+    } finally {
+        isLoadingMore = false;
+    }
+    maybeLoadMore();
+}
+
 function renderPosts() {
     const feed = document.getElementById('postsFeed');
     const filteredPosts = posts.filter(post => {
@@ -71,11 +179,7 @@ function createPostCard(post) {
         const mediaCount = Math.min(post.media.length, 4);
         mediaHtml = `<div class="matt_post-media-grid matt_ media-${mediaCount}">`;
         post.media.slice(0, 4).forEach(m => {
-            if (m.type === 'video') {
-                mediaHtml += `<div class="matt_post-media-item"><video src="${m.url}" muted></video></div>`;
-            } else {
-                mediaHtml += `<div class="matt_post-media-item"><img src="${m.url}" alt="Post media"></div>`;
-            }
+            mediaHtml += `<div class="matt_post-media-item">${renderMediaItem(m, mediaCount, 'muted')}</div>`;
         });
         mediaHtml += '</div>';
     }
@@ -111,7 +215,7 @@ function createPostCard(post) {
                 ` : ''}
             </div>
             <div class="matt_post-content">
-                ${post.text ? `<div class="matt_post-text">${escapeHtml(post.text)}</div>` : ''}
+                ${post.text ? `<div class="matt_post-text">${post.highlight || escapeHtml(post.text)}</div>` : ''}
                 ${mediaHtml}
                 ${pollHtml}
             </div>
@@ -132,6 +236,42 @@ function createPostCard(post) {
     `;
 }
 
+const MEDIA_URL_PATTERN = /^\/media\/[0-9a-f]{64}\.[a-z0-9]+$/;
+
+// Media URLs go into src attributes unescaped, so anything that is not a
+// stored /media/ file (say, a row saved before uploads were validated) is
+// dropped rather than rendered.
+function mediaUrl(url) {
+    return MEDIA_URL_PATTERN.test(url || '') ? url : '';
+}
+
+// Images use the resized variants once the server has rendered them, WebP
+// first, and fall back to the original until then. Videos show their poster
+// frame and only fetch the clip when played.
+function renderMediaItem(m, mediaCount, videoAttrs) {
+    const url = mediaUrl(m.url);
+    if (m.type === 'video') {
+        const posterUrl = mediaUrl(m.poster);
+        const poster = posterUrl ? ` poster="${posterUrl}" preload="none"` : ' preload="metadata"';
+        return `<video src="${url}"${poster} ${videoAttrs}></video>`;
+    }
+
+    const variants = (m.variants || []).filter(v => mediaUrl(v.url));
+    if (variants.length === 0) {
+        return `<img src="${url}" alt="Post media" loading="lazy">`;
+    }
+    const sizes = mediaCount === 1 ? '(max-width: 640px) 100vw, 640px' : '(max-width: 640px) 50vw, 320px';
+    const srcset = format => variants.filter(v => v.format === format).map(v => `${v.url} ${v.width}w`).join(', ');
+    const fallback = variants.filter(v => v.format !== 'webp');
+    const fallbackSrcset = srcset(fallback.length > 0 ? fallback[0].format : 'webp');
+    return `
+        <picture>
+            <source type="image/webp" srcset="${srcset('webp')}" sizes="${sizes}">
+            <img src="${url}" srcset="${fallbackSrcset}" sizes="${sizes}" alt="Post media" loading="lazy">
+        </picture>
+    `;
+}
+
 function renderPoll(poll, postId) {
     const hasVoted = poll.userVote !== null;
     
@@ -165,36 +305,8 @@ function renderPoll(poll, postId) {
     `;
 }
 
-async function votePoll(pollId, optionId, postId) {
-    try {
-        const response = await fetch(`/api/polls/${pollId}/vote`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ userId: APP_USER.id, optionId: optionId })
-        });
-        
-        if (!response.ok) {
-            const error = await response.json();
-            showToast(error.error || 'Error voting', 'error');
-            return;
-        }
-        
-        const result = await response.json();
-        const post = posts.find(p => p.id === postId);
-        if (post && post.poll) {
-            post.poll.options = result.options;
-            post.poll.totalVotes = result.totalVotes;
-            post.poll.userVote = result.userVote;
-            renderPosts();
-            if (currentPostId === postId) {
-                renderModalPost(post);
-            }
-            showToast('Vote recorded! 🗳️', 'success');
-        }
-    } catch (error) {
-        console.error('Error voting:', error);
-        showToast('Error voting');
-    }
+function votePoll(pollId, optionId, postId) {
+    queueInteraction(`poll:${pollId}`, { op: 'vote', pollId: pollId, optionId: optionId, postId: postId });
 }
 
 function setupFilterButtons() {
@@ -214,6 +326,9 @@ function handleSearchKeyup(event) {
     if (searchTimeout) {
         clearTimeout(searchTimeout);
     }
+    if (suggestTimeout) {
+        clearTimeout(suggestTimeout);
+    }
     
     const clearBtn = document.getElementById('searchClearBtn');
     if (query.length > 0) {
@@ -226,33 +341,75 @@ function handleSearchKeyup(event) {
         return;
     }
     
+    // Suggestions are cheap and follow every keystroke; the full search
+    // waits for a longer pause, Enter, or a picked suggestion.
+    suggestTimeout = setTimeout(() => {
+        fetchSuggestions(query);
+    }, SUGGEST_DEBOUNCE_MS);
+    
     if (query.length < 2) return;
     
     searchTimeout = setTimeout(() => {
         performSearch(query);
-    }, 300);
+    }, SEARCH_DEBOUNCE_MS);
+}
+
+function handleSearchChange(event) {
+    const query = event.target.value.trim();
+    if (query.length < 2) return;
+    
+    if (searchTimeout) {
+        clearTimeout(searchTimeout);
+    }
+    performSearch(query);
+}
+
+async function fetchSuggestions(query) {
+    try {
+        const response = await fetch(`/api/search/suggest?q=${encodeURIComponent(query)}`);
+        const data = await response.json();
+        if (document.getElementById('searchInput').value.trim() !== query) return;
+        
+        const list = document.getElementById('searchSuggestions');
+        list.replaceChildren(...data.suggestions.map(s => {
+            const option = document.createElement('option');
+            option.value = s.text;
+            return option;
+        }));
+    } catch (error) {
+        console.error('Error fetching suggestions:', error);
+    }
 }
 
 async function performSearch(query) {
+    if (isSearching && query === currentQuery) return;
+    
     try {
-        const response = await fetch(`/api/posts/search?q=${encodeURIComponent(query)}&userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}`);
-        const results = await response.json();
+        const response = await fetch(`/api/posts/search?q=${encodeURIComponent(query)}&userId=${APP_USER.id}&wordId=${CURRENT_WORD_ID}&limit=${PAGE_SIZE}`);
+        const data = await response.json();
         
-        posts = results;
+        posts = data.posts;
+        searchCursor = data.nextCursor;
+        currentQuery = query;
         isSearching = true;
         
-        const header = document.getElementById('searchResultsHeader');
-        const text = document.getElementById('searchResultsText');
-        text.textContent = `Found ${results.length} result${results.length !== 1 ? 's' : ''} for "${query}"`;
-        header.classList.add('matt_show');
+        updateSearchHeader();
+        document.getElementById('searchResultsHeader').classList.add('matt_show');
         
         renderPosts();
+        maybeLoadMore();
     } catch (error) {
         console.error('Error searching:', error);
         showToast('Error searching posts');
     }
 }
 
+function updateSearchHeader() {
+    const text = document.getElementById('searchResultsText');
+    const count = `${posts.length}${searchCursor ? '+' : ''}`;
+    text.textContent = `Found ${count} result${posts.length !== 1 || searchCursor ? 's' : ''} for "${currentQuery}"`;
+}
+
 function clearSearch() {
     document.getElementById('searchInput').value = '';
     document.getElementById('searchClearBtn').classList.remove('matt_show');
@@ -260,6 +417,8 @@ function clearSearch() {
     
     posts = [...allPosts];
     isSearching = false;
+    currentQuery = '';
+    searchCursor = null;
     renderPosts();
 }
 
@@ -267,13 +426,39 @@ async function fetchNotifications() {
     try {
         const response = await fetch(`/api/notifications?userId=${APP_USER.id}`);
         const data = await response.json();
-        renderNotifications(data.notifications);
+        notifications = data.notifications;
+        renderNotifications(notifications);
         updateNotificationBadge(data.unreadCount);
     } catch (error) {
         console.error('Error fetching notifications:', error);
     }
 }
 
+function connectNotificationStream() {
+    if (!window.EventSource) {
+        fetchNotifications();
+        setInterval(fetchNotifications, NOTIFICATION_POLL_MS);
+        return;
+    }
+    
+    const source = new EventSource(`/api/notifications/stream?userId=${encodeURIComponent(APP_USER.id)}`);
+    
+    // Every (re)connect resyncs once, covering anything sent while the
+    // stream was down; after that the server pushes changes.
+    source.addEventListener('open', () => fetchNotifications());
+    
+    source.addEventListener('notification', (event) => {
+        const data = JSON.parse(event.data);
+        notifications = [data.notification, ...notifications.filter(n => n.id !== data.notification.id)].slice(0, 20);
+        renderNotifications(notifications);
+        updateNotificationBadge(data.unreadCount);
+    });
+    
+    source.addEventListener('unread', (event) => {
+        updateNotificationBadge(JSON.parse(event.data).unreadCount);
+    });
+}
+
 function renderNotifications(notifications) {
     const list = document.getElementById('notificationList');
     
@@ -380,27 +565,18 @@ document.addEventListener('click', () => {
     document.querySelectorAll('.matt_dropdown-menu-custom').forEach(m => m.classList.remove('matt_show'));
 });
 
-async function toggleLike(postId) {
-    try {
-        const response = await fetch(`/api/posts/${postId}/like`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ userId: APP_USER.id })
-        });
-        const result = await response.json();
-        
-        const post = posts.find(p => p.id === postId);
-        if (post) {
-            post.likes = result.likes;
-            post.liked = result.liked;
-            renderPosts();
-            if (currentPostId === postId) {
-                renderModalPost(post);
-            }
-        }
-    } catch (error) {
-        console.error('Error toggling like:', error);
+function toggleLike(postId) {
+    const post = posts.find(p => p.id === postId);
+    if (!post) return;
+
+    const confirmed = post.liked;
+    post.liked = !post.liked;
+    post.likes += post.liked ? 1 : -1;
+    renderPosts();
+    if (currentPostId === postId) {
+        renderModalPost(post);
     }
+    queueInteraction(`post:${postId}`, { op: post.liked ? 'like' : 'unlike', postId: postId }, confirmed, post.liked);
 }
 
 function openPostDetail(postId) {
@@ -425,11 +601,7 @@ function renderModalPost(post) {
         const mediaCount = Math.min(post.media.length, 4);
         mediaHtml = `<div class="matt_post-media-grid matt_ media-${mediaCount}">`;
         post.media.slice(0, 4).forEach(m => {
-            if (m.type === 'video') {
-                mediaHtml += `<div class="matt_post-media-item"><video src="${m.url}" controls></video></div>`;
-            } else {
-                mediaHtml += `<div class="matt_post-media-item"><img src="${m.url}" alt="Post media"></div>`;
-            }
+            mediaHtml += `<div class="matt_post-media-item">${renderMediaItem(m, mediaCount, 'controls')}</div>`;
         });
         mediaHtml += '</div>';
     }
@@ -548,9 +720,10 @@ async function addComment(event) {
     if (!currentPostId) return;
 
     try {
+        const keyScope = `comment:${currentPostId}`;
         const response = await fetch(`/api/posts/${currentPostId}/comments`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': writeKeyFor(keyScope) },
             body: JSON.stringify({
                 userId: APP_USER.id,
                 author: APP_USER.name,
@@ -559,6 +732,7 @@ async function addComment(event) {
                 text: text
             })
         });
+        settleWriteKey(keyScope);
         
         if (!response.ok) {
             const error = await response.json();
@@ -568,7 +742,7 @@ async function addComment(event) {
         
         const newComment = await response.json();
         const post = posts.find(p => p.id === currentPostId);
-        if (post) {
+        if (post && !post.comments.some(c => c.id === newComment.id)) {
             post.comments.unshift(newComment);
             input.value = '';
             renderComments(post);
@@ -634,7 +808,7 @@ function confirmDeleteComment(commentId) {
     document.getElementById('confirmModal').classList.add('matt_show');
 }
 
-async function toggleCommentLike(commentId) {
+function toggleCommentLike(commentId) {
     if (!currentPostId) return;
     
     const post = posts.find(p => p.id === currentPostId);
@@ -643,39 +817,166 @@ async function toggleCommentLike(commentId) {
     const comment = post.comments.find(c => c.id === commentId);
     if (!comment) return;
     
+    const confirmed = comment.liked;
+    comment.liked = !comment.liked;
+    comment.likes += comment.liked ? 1 : -1;
+    renderCommentLike(comment);
+    queueInteraction(
+        `comment:${commentId}`,
+        { op: comment.liked ? 'likeComment' : 'unlikeComment', commentId: commentId, postId: currentPostId },
+        confirmed,
+        comment.liked
+    );
+}
+
+function renderCommentLike(comment) {
+    const likesSpan = document.getElementById(`comment-likes-${comment.id}`);
+    if (likesSpan) {
+        likesSpan.textContent = comment.likes;
+    }
+    
+    const likeBtn = likesSpan?.closest('.comment-like-btn');
+    if (likeBtn) {
+        if (comment.liked) {
+            likeBtn.classList.add('matt_liked');
+        } else {
+            likeBtn.classList.remove('matt_liked');
+        }
+    }
+}
+
+// Likes and votes are applied to the page immediately and sent to the
+// server in batches. The outbox holds one pending operation per target, so
+// rapid toggles collapse into the final state, and a toggle back to the
+// last confirmed state drops the operation entirely. Each operation keeps
+// its idempotency key across retries, so a request that reached the server
+// but lost its response is not applied twice.
+function newInteractionKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// A submission keeps its Idempotency-Key until the server answers, so a
+// double click or a resubmit after a dropped connection is recognised as
+// the same request instead of creating a duplicate.
+function writeKeyFor(scope) {
+    if (!writeKeys.has(scope)) {
+        writeKeys.set(scope, newInteractionKey());
+    }
+    return writeKeys.get(scope);
+}
+
+function settleWriteKey(scope) {
+    writeKeys.delete(scope);
+}
+
+function queueInteraction(slot, operation, confirmed, desired) {
+    const pending = outbox.get(slot);
+    const baseline = pending ? pending.confirmed : confirmed;
+    if (pending && desired !== undefined && desired === baseline) {
+        outbox.delete(slot);
+        return;
+    }
+    outbox.set(slot, { operation: { ...operation, key: newInteractionKey() }, confirmed: baseline });
+    scheduleOutboxFlush(OUTBOX_DELAY_MS);
+}
+
+function scheduleOutboxFlush(delay) {
+    if (outboxTimer) return;
+    outboxTimer = setTimeout(() => {
+        outboxTimer = null;
+        flushOutbox();
+    }, delay);
+}
+
+function takeOutbox() {
+    const entries = [...outbox.entries()];
+    outbox.clear();
+    return entries;
+}
+
+async function flushOutbox() {
+    const entries = takeOutbox();
+    if (entries.length === 0) return;
+
     try {
-        const response = await fetch(`/api/posts/${currentPostId}/comments/${commentId}/like`, {
+        const response = await fetch('/api/interactions/batch', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ userId: APP_USER.id })
+            body: JSON.stringify({ userId: APP_USER.id, operations: entries.map(([, entry]) => entry.operation) })
         });
-        
+        if (response.status >= 500) {
+            throw new Error(`Server error ${response.status}`);
+        }
+        const data = await response.json();
         if (!response.ok) {
-            const error = await response.json();
-            showToast(error.error || 'Error liking comment', 'error');
+            showToast(data.error || 'Error saving changes', 'error');
             return;
         }
-        
-        const result = await response.json();
-        comment.likes = result.likes;
-        comment.liked = result.liked;
-        
-        const likesSpan = document.getElementById(`comment-likes-${commentId}`);
-        if (likesSpan) {
-            likesSpan.textContent = result.likes;
+        outboxRetryMs = 0;
+        data.results.forEach(applyInteractionResult);
+    } catch (error) {
+        console.error('Error sending interactions:', error);
+        // Put back anything that has not been superseded by a newer toggle,
+        // with the same keys, and retry with backoff.
+        entries.forEach(([slot, entry]) => {
+            if (!outbox.has(slot)) {
+                outbox.set(slot, entry);
+            }
+        });
+        outboxRetryMs = Math.min(Math.max(outboxRetryMs * 2, 1000), OUTBOX_MAX_RETRY_MS);
+        scheduleOutboxFlush(outboxRetryMs);
+    }
+}
+
+function flushOutboxOnExit() {
+    if (outbox.size === 0 || !navigator.sendBeacon) return;
+    const operations = takeOutbox().map(([, entry]) => entry.operation);
+    const body = new Blob([JSON.stringify({ userId: APP_USER.id, operations: operations })], { type: 'application/json' });
+    navigator.sendBeacon('/api/interactions/batch', body);
+}
+
+function applyInteractionResult(result) {
+    if (!result.ok) {
+        showToast(result.error || 'Error saving changes', 'error');
+        return;
+    }
+
+    if (result.op === 'like' || result.op === 'unlike') {
+        const post = posts.find(p => p.id === result.postId);
+        if (!post || outbox.has(`post:${result.postId}`)) return;
+        post.likes = result.likes;
+        post.liked = result.liked;
+        renderPosts();
+        if (currentPostId === post.id) {
+            renderModalPost(post);
         }
-        
-        const likeBtn = likesSpan?.closest('.comment-like-btn');
-        if (likeBtn) {
-            if (result.liked) {
-                likeBtn.classList.add('matt_liked');
-            } else {
-                likeBtn.classList.remove('matt_liked');
+    } else if (result.op === 'likeComment' || result.op === 'unlikeComment') {
+        if (outbox.has(`comment:${result.commentId}`)) return;
+        for (const post of posts) {
+            const comment = (post.comments || []).find(c => c.id === result.commentId);
+            if (comment) {
+                comment.likes = result.likes;
+                comment.liked = result.liked;
+                renderCommentLike(comment);
+                break;
             }
         }
-    } catch (error) {
-        console.error('Error liking comment:', error);
-        showToast('Error liking comment');
+    } else if (result.op === 'vote' && result.poll) {
+        const post = posts.find(p => p.poll && p.poll.id === result.pollId);
+        if (!post) return;
+        post.poll.options = result.poll.options;
+        post.poll.totalVotes = result.poll.totalVotes;
+        post.poll.userVote = result.poll.userVote;
+        renderPosts();
+        if (currentPostId === post.id) {
+            renderModalPost(post);
+        }
+        if (!result.replayed) {
+            showToast('Vote recorded! 🗳️', 'success');
+        }
     }
 }
 
@@ -731,21 +1032,43 @@ function previewMedia(event, mode) {
     files.forEach(file => {
         if (mediaFiles.length >= 4) return;
         
-        const reader = new FileReader();
-        reader.onload = (e) => {
-            mediaFiles.push({
-                type: file.type.startsWith('video') ? 'video' : 'image',
-                url: e.target.result,
-                file: file
-            });
-            renderMediaPreview(mode);
-        };
-        reader.readAsDataURL(file);
+        // The upload starts right away, while the user is still writing,
+        // and the post only sends the returned media id.
+        const upload = uploadMedia(file);
+        upload.catch(error => showToast(error.message, 'error'));
+        mediaFiles.push({
+            type: file.type.startsWith('video') ? 'video' : 'image',
+            url: URL.createObjectURL(file),
+            file: file,
+            upload: upload
+        });
     });
+    renderMediaPreview(mode);
 
     event.target.value = '';
 }
 
+async function uploadMedia(file) {
+    const body = new FormData();
+    body.append('file', file);
+    const response = await fetch('/api/media', { method: 'POST', body: body });
+    const result = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        throw new Error(result.error || 'Error uploading media');
+    }
+    return result;
+}
+
+async function mediaReferences(mediaFiles) {
+    return Promise.all(mediaFiles.map(async m => {
+        if (!m.upload) {
+            return { type: m.type, url: m.url };
+        }
+        const uploaded = await m.upload;
+        return { id: uploaded.id };
+    }));
+}
+
 function renderMediaPreview(mode) {
     const mediaFiles = mode === 'create' ? createMediaFiles : editMediaFiles;
     const container = document.getElementById(mode === 'create' ? 'createMediaPreview' : 'editMediaPreview');
@@ -766,10 +1089,10 @@ function renderMediaPreview(mode) {
 }
 
 function removeMediaPreview(index, mode) {
-    if (mode === 'create') {
-        createMediaFiles.splice(index, 1);
-    } else {
-        editMediaFiles.splice(index, 1);
+    const mediaFiles = mode === 'create' ? createMediaFiles : editMediaFiles;
+    const [removed] = mediaFiles.splice(index, 1);
+    if (removed && removed.file) {
+        URL.revokeObjectURL(removed.url);
     }
     renderMediaPreview(mode);
 }
@@ -805,9 +1128,10 @@ async function createPost(event) {
     if (text && !validateTextLength(text, 1000, 'Post')) return;
 
     try {
+        const media = await mediaReferences(createMediaFiles);
         const response = await fetch('/api/posts', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': writeKeyFor('createPost') },
             body: JSON.stringify({
                 userId: APP_USER.id,
                 author: APP_USER.name,
@@ -816,10 +1140,11 @@ async function createPost(event) {
                 type: APP_USER.type,
                 text: text,
                 wordId: CURRENT_WORD_ID,
-                media: createMediaFiles.map(m => ({ type: m.type, url: m.url })),
+                media: media,
                 poll: pollData
             })
         });
+        settleWriteKey('createPost');
 
         if (!response.ok) {
             const error = await response.json();
@@ -829,6 +1154,7 @@ async function createPost(event) {
 
         const newPost = await response.json();
         newPost.liked = false;
+        if (posts.some(p => p.id === newPost.id)) return;
         posts.unshift(newPost);
         renderPosts();
         closeCreateModal();
@@ -874,12 +1200,13 @@ async function saveEditPost(event) {
     if (text && !validateTextLength(text, 1000, 'Post')) return;
 
     try {
+        const media = await mediaReferences(editMediaFiles);
         const response = await fetch(`/api/posts/${editingPostId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 text: text,
-                media: editMediaFiles.map(m => ({ type: m.type, url: m.url }))
+                media: media
             })
         });
 
@@ -889,10 +1216,11 @@ async function saveEditPost(event) {
             return;
         }
 
+        const result = await response.json();
         const post = posts.find(p => p.id === editingPostId);
         if (post) {
             post.text = text;
-            post.media = editMediaFiles.map(m => ({ type: m.type, url: m.url }));
+            post.media = result.media;
             renderPosts();
             closeEditModal();
             
@@ -0,0 +1,109 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+# Unset uses Jinja's own per-user directory under the system temp dir.
+TEMPLATE_CACHE_DIR = os.environ.get('BRIDGEGEN_TEMPLATE_CACHE_DIR')
+
+
+class FragmentCache:
+    # Rendered template fragments, keyed by everything the fragment depends
+    # on, so an entry never needs invalidating: a change shows up as a new
+    # key and the old entry ages out of the LRU.
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'name', key, ... %} ... {% endcache %} renders its body once
+    # per distinct key and replays the output afterwards. The key has to
+    # name every variable the body uses.
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render_fragment', [nodes.Const(parser.name), nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, template_name, key, caller):
+        key = (template_name, *key)
+        fragment = fragment_cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            fragment_cache.put(key, fragment)
+        return fragment
+
+
+def _private_directory(path):
+    # Jinja unmarshals whatever it finds in the cache directory, so it must
+    # be a real directory owned by this user that nobody else can write to.
+    try:
+        os.makedirs(path, mode=stat.S_IRWXU, exist_ok=True)
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            return False
+        if stat.S_IMODE(info.st_mode) != stat.S_IRWXU:
+            os.chmod(path, stat.S_IRWXU)
+        return True
+    except OSError:
+        return False
+
+
+def template_bytecode_cache(directory=None):
+    if directory is None:
+        return FileSystemBytecodeCache()
+    if not _private_directory(directory):
+        print(f"Not caching template bytecode: {directory} is not a private directory owned by this user")
+        return None
+    return FileSystemBytecodeCache(directory)
+
+
+def configure_templates(app):
+    # Compiled templates are kept on disk and shared by every worker on the
+    # host, so a new worker loads bytecode instead of recompiling.
+    app.jinja_env.bytecode_cache = template_bytecode_cache(TEMPLATE_CACHE_DIR)
+    app.jinja_env.add_extension(FragmentCacheExtension)
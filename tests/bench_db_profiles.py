@@ -0,0 +1,101 @@
+"""Read throughput of the feed while a writer toggles likes, per DB profile.
+
+    python tests/bench_db_profiles.py [--seconds 5] [--readers 4]
+
+Each profile gets its own freshly seeded database in a temporary
+directory; the working tree's bridgegen.db is not touched.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import mutations  # noqa: E402
+from feed import fetch_post_page, hydrate_posts  # noqa: E402
+
+
+def run_profile(name, seconds, readers, page_size):
+    database.DB_PROFILE = database.DB_PROFILES[name]
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix=f'bridgegen-bench-{name}-'), 'bridgegen.db')
+    database.init_database()
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def read_loop():
+        reads, samples = 0, []
+        conn = database.get_db()
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                cursor = conn.cursor()
+                posts, _ = fetch_post_page(cursor, None, None, page_size)
+                hydrate_posts(cursor, posts, 'user-matt')
+                samples.append(time.perf_counter() - start)
+                reads += 1
+        finally:
+            conn.close()
+        with lock:
+            counts['reads'] += reads
+            latencies.extend(samples)
+
+    def write_loop():
+        conn = database.get_db()
+        post_ids = [row[0] for row in conn.execute("SELECT id FROM posts")]
+        user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+        n = 0
+        try:
+            while not stop.is_set():
+                try:
+                    mutations.toggle_post_like(conn, post_ids[n % len(post_ids)], user_ids[n % len(user_ids)])
+                    counts['writes'] += 1
+                except database.sqlite3.Error:
+                    counts['errors'] += 1
+                n += 1
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+    threads.append(threading.Thread(target=write_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+    return {
+        'profile': name,
+        'reads/s': counts['reads'] / seconds,
+        'writes/s': counts['writes'] / seconds,
+        'read p99 ms': p99 * 1000,
+        'write errors': counts['errors']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run_profile(name, args.seconds, args.readers, args.page_size) for name in database.DB_PROFILES]
+    columns = list(results[0])
+    print(' | '.join(f'{column:>12}' for column in columns))
+    for result in results:
+        print(' | '.join(f'{value:>12.1f}' if isinstance(value, float) else f'{value:>12}'
+                         for value in result.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep uploads and compiled templates out of the working tree.
+_scratch = tempfile.mkdtemp(prefix='bridgegen-tests-')
+os.environ.setdefault('BRIDGEGEN_MEDIA_DIR', os.path.join(_scratch, 'media'))
+os.environ.setdefault('BRIDGEGEN_TEMPLATE_CACHE_DIR', os.path.join(_scratch, 'jinja'))
+
+import database  # noqa: E402
+import feed  # noqa: E402
+import mutations  # noqa: E402
+import routes  # noqa: E402
+import thumbnails  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A freshly created and seeded database; the pool follows DB_PATH, and
+    # the in-process caches are replaced so nothing leaks between tests.
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'bridgegen.db'))
+    cache, tally = feed.FeedCache(), feed.PollTally()
+    for module in (feed, routes, thumbnails):
+        monkeypatch.setattr(module, 'feed_cache', cache)
+    for module in (feed, mutations, routes):
+        monkeypatch.setattr(module, 'poll_tally', tally)
+    database.init_database()
+    yield database.DB_PATH
+
+
+@pytest.fixture
+def conn(db):
+    conn = database.get_db()
+    yield conn
+    conn.close()
+
+
+def make_client():
+    # The routes on a bare Flask app: background tasks stay stopped, so
+    # writes go through run_in_transaction and notifications are inline.
+    from flask import Flask
+
+    from idempotency import register_idempotency
+
+    app = Flask(__name__)
+    register_idempotency(app)
+    routes.register_routes(app)
+    database.register_db_teardown(app)
+    return app.test_client()
+
+
+@pytest.fixture
+def client(db):
+    return make_client()
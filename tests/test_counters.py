@@ -0,0 +1,121 @@
+import random
+import threading
+
+import pytest
+
+import database
+import mutations
+import notifications
+import routes
+from counters import fold_counters, pending_delta_sql
+
+THREADS = 8
+OPERATIONS_PER_THREAD = 60
+
+# Each denormalized counter next to the count of the rows it stands for.
+DRIFT_QUERIES = {
+    'posts': f"""
+        SELECT id, likes_count + {pending_delta_sql('post_likes', 'p.id')},
+               (SELECT COUNT(*) FROM likes WHERE post_id = p.id)
+        FROM posts p
+    """,
+    'comments': """
+        SELECT id, likes_count, (SELECT COUNT(*) FROM comment_likes WHERE comment_id = c.id)
+        FROM comments c
+    """,
+    'poll_options': f"""
+        SELECT id, votes_count + {pending_delta_sql('poll_votes', 'o.id')},
+               (SELECT COUNT(*) FROM poll_votes WHERE option_id = o.id)
+        FROM poll_options o
+    """
+}
+
+
+def reconcile_seed_counters(conn):
+    # The sample data has counts without matching rows; start from counters
+    # that agree with the join tables.
+    conn.execute("UPDATE posts SET likes_count = (SELECT COUNT(*) FROM likes WHERE post_id = posts.id)")
+    conn.execute("UPDATE comments SET likes_count = (SELECT COUNT(*) FROM comment_likes WHERE comment_id = comments.id)")
+    conn.execute("UPDATE poll_options SET votes_count = (SELECT COUNT(*) FROM poll_votes WHERE option_id = poll_options.id)")
+    conn.execute("DELETE FROM counter_deltas")
+    conn.commit()
+
+
+def drift(conn):
+    return {
+        table: [row[0] for row in conn.execute(sql) if row[1] != row[2]]
+        for table, sql in DRIFT_QUERIES.items()
+    }
+
+
+@pytest.mark.parametrize('batching', [False, True], ids=['direct', 'batched'])
+def test_counters_match_join_tables_under_concurrent_writes(client, monkeypatch, batching):
+    conn = database.get_db()
+    try:
+        reconcile_seed_counters(conn)
+        users = [row[0] for row in conn.execute("SELECT id FROM users")]
+        posts = [row[0] for row in conn.execute("SELECT id FROM posts LIMIT 4")]
+        comments = [tuple(row) for row in conn.execute("SELECT id, post_id FROM comments LIMIT 4")]
+        polls = [(row[0], [opt[0] for opt in conn.execute("SELECT id FROM poll_options WHERE poll_id = ?", (row[0],))])
+                 for row in conn.execute("SELECT id FROM polls LIMIT 3")]
+    finally:
+        conn.close()
+
+    # As in the app, notifications are written by the dispatcher thread
+    # rather than inline on a second connection from the request thread.
+    dispatcher = notifications.NotificationDispatcher()
+    monkeypatch.setattr(routes, 'dispatcher', dispatcher)
+    dispatcher.start()
+    batcher = mutations.WriteBatcher()
+    monkeypatch.setattr(mutations, 'write_batcher', batcher)
+    if batching:
+        batcher.start()
+
+    failures = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        for n in range(OPERATIONS_PER_THREAD):
+            user_id = rnd.choice(users)
+            post_id = rnd.choice(posts)
+            comment_id, comment_post = rnd.choice(comments)
+            poll_id, options = rnd.choice(polls)
+            pick = rnd.random()
+            if pick < 0.3:
+                response = client.post(f'/api/posts/{post_id}/like', json={'userId': user_id})
+            elif pick < 0.5:
+                response = client.post(f'/api/posts/{comment_post}/comments/{comment_id}/like', json={'userId': user_id})
+            elif pick < 0.75:
+                response = client.post(f'/api/polls/{poll_id}/vote', json={'userId': user_id, 'optionId': rnd.choice(options)})
+            elif pick < 0.95:
+                response = client.post('/api/interactions/batch', json={'userId': user_id, 'operations': [
+                    {'key': f'{seed}-{n}-a', 'op': rnd.choice(['like', 'unlike']), 'postId': post_id},
+                    {'key': f'{seed}-{n}-b', 'op': rnd.choice(['likeComment', 'unlikeComment']),
+                     'postId': comment_post, 'commentId': comment_id},
+                    {'key': f'{seed}-{n}-c', 'op': 'vote', 'pollId': poll_id, 'optionId': rnd.choice(options)}
+                ]})
+            else:
+                fold_counters()
+                continue
+            if response.status_code >= 500:
+                failures.append(response.get_json())
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.stop()
+    dispatcher.stop()
+
+    assert failures == []
+    conn = database.get_db()
+    try:
+        assert drift(conn) == {table: [] for table in DRIFT_QUERIES}
+        fold_counters()
+        assert drift(conn) == {table: [] for table in DRIFT_QUERIES}
+        assert conn.execute("SELECT COUNT(*) FROM counter_deltas").fetchone()[0] == 0
+    finally:
+        conn.close()
+    if batching:
+        assert batcher.stats()['batches'] > 0
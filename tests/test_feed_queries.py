@@ -0,0 +1,48 @@
+import feed
+from feed import fetch_post_page, hydrate_posts
+
+
+def add_posts(conn, word_id, count):
+    # Posts that use every table the feed reads, so each page has media,
+    # comments, polls and viewer state to load.
+    for n in range(count):
+        post_id = f'post-q{n}'
+        conn.execute("INSERT INTO posts (id, user_id, word_id, text, likes_count) VALUES (?, 'user-1', ?, ?, ?)",
+                     (post_id, word_id, f'post {n}', n))
+        conn.execute("INSERT INTO post_media (post_id, media_type, url) VALUES (?, 'image', ?)",
+                     (post_id, f'/media/{n:064x}.jpg'))
+        conn.execute("INSERT INTO comments (id, post_id, user_id, text) VALUES (?, ?, 'user-2', 'hi')",
+                     (f'c-q{n}', post_id))
+        conn.execute("INSERT INTO polls (id, post_id, question) VALUES (?, ?, 'Which?')", (f'poll-q{n}', post_id))
+        for option in 'ab':
+            conn.execute("INSERT INTO poll_options (id, poll_id, text) VALUES (?, ?, ?)",
+                         (f'opt-q{n}{option}', f'poll-q{n}', option))
+        conn.execute("INSERT INTO likes (post_id, user_id) VALUES (?, 'user-matt')", (post_id,))
+        conn.execute("INSERT INTO comment_likes (comment_id, user_id) VALUES (?, 'user-matt')", (f'c-q{n}',))
+        conn.execute("INSERT INTO poll_votes (poll_id, option_id, user_id) VALUES (?, ?, 'user-matt')",
+                     (f'poll-q{n}', f'opt-q{n}a'))
+    conn.commit()
+
+
+def count_statements(conn, word_id, limit):
+    # Fresh tally, so both pages pay for the poll option query.
+    feed.poll_tally = feed.PollTally()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        posts, _ = fetch_post_page(conn.cursor(), word_id, None, limit)
+        page = hydrate_posts(conn.cursor(), posts, 'user-matt')
+    finally:
+        conn.set_trace_callback(None)
+    assert len(page) == limit
+    return statements
+
+
+def test_feed_statement_count_does_not_grow_with_page_size(conn):
+    word_id = conn.execute("SELECT MAX(id) FROM word_of_day").fetchone()[0]
+    add_posts(conn, word_id, 60)
+
+    small = count_statements(conn, word_id, 2)
+    large = count_statements(conn, word_id, 50)
+
+    assert len(small) == len(large)
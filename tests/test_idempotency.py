@@ -0,0 +1,64 @@
+import idempotency
+from conftest import make_client
+from idempotency import IdempotencyStore
+
+
+def new_worker(monkeypatch):
+    # A second worker process: its own app and an empty in-memory state.
+    monkeypatch.setattr(idempotency, 'idempotency_store', IdempotencyStore())
+    return make_client()
+
+
+def test_retry_on_another_worker_is_replayed(client, conn, monkeypatch):
+    headers = {'Idempotency-Key': 'like-once'}
+    first = client.post('/api/posts/post-1/like', json={'userId': 'user-5'}, headers=headers)
+    retry = new_worker(monkeypatch).post('/api/posts/post-1/like', json={'userId': 'user-5'}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json() == {'likes': first.get_json()['likes'], 'liked': True}
+    assert conn.execute("SELECT COUNT(*) FROM likes WHERE post_id = 'post-1' AND user_id = 'user-5'").fetchone()[0] == 1
+
+
+def test_reused_key_with_a_different_body_conflicts(client, monkeypatch):
+    headers = {'Idempotency-Key': 'reused'}
+    comment = {'userId': 'user-5', 'author': 'Joel Lim', 'initials': 'JL', 'type': 'youth'}
+    client.post('/api/posts/post-1/comments', json={**comment, 'text': 'first'}, headers=headers)
+    other = new_worker(monkeypatch).post('/api/posts/post-1/comments', json={**comment, 'text': 'second'},
+                                         headers=headers)
+    assert other.status_code == 409
+
+
+def test_same_key_from_another_user_is_not_replayed(client, conn):
+    headers = {'Idempotency-Key': 'shared'}
+    client.post('/api/posts/post-1/like', json={'userId': 'user-5'}, headers=headers)
+    other = client.post('/api/posts/post-1/like', json={'userId': 'user-6'}, headers=headers)
+    assert other.status_code == 200
+    assert 'Idempotent-Replayed' not in other.headers
+    assert conn.execute("SELECT COUNT(*) FROM likes WHERE post_id = 'post-1' AND user_id = 'user-6'").fetchone()[0] == 1
+
+
+def test_media_uploads_are_not_keyed(client, conn):
+    client.post('/api/media', data=b'', headers={'Idempotency-Key': 'upload'})
+    assert conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] == 0
+
+
+def test_key_in_flight_on_another_worker_waits_for_its_response(db):
+    first, second = IdempotencyStore(), IdempotencyStore()
+    scoped_key = ('POST /api/posts/post-1/like user-5', 'in-flight')
+    assert first.claim(scoped_key, 'abc') == ('new', None)
+    assert second.claim(scoped_key, 'abc', timeout=0.2) == ('conflict', None)
+
+    first.complete(scoped_key, (200, {'Content-Type': 'application/json'}, b'{}'))
+    assert second.claim(scoped_key, 'abc') == ('replay', (200, {'Content-Type': 'application/json'}, b'{}'))
+
+
+def test_released_and_abandoned_claims_can_be_retried(db):
+    store = IdempotencyStore(claim_timeout=0)
+    scoped_key = ('POST /api/interactions/batch user-5', 'retry')
+    assert store.claim(scoped_key, 'abc') == ('new', None)
+    store.release(scoped_key)
+    assert store.claim(scoped_key, 'abc') == ('new', None)
+    # Never completed: with no claim timeout it is taken over at once.
+    assert IdempotencyStore(claim_timeout=0).claim(scoped_key, 'abc') == ('new', None)
+    assert store.prune() == {'pruned': 0, 'abandoned': 1}
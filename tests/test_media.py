@@ -0,0 +1,49 @@
+import pytest
+
+import media
+from media import MEDIA_URL_PREFIX, resolve_post_media, store_media_bytes
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+POST = {'userId': 'user-1', 'author': 'Joel Lim', 'initials': 'JL', 'age': 19, 'type': 'youth', 'text': 'media'}
+
+
+@pytest.fixture
+def stored_png(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, 'MEDIA_DIR', str(tmp_path / 'media'))
+    return store_media_bytes(PNG, 'image/png')[len(MEDIA_URL_PREFIX):]
+
+
+def test_stored_media_resolves_by_id_or_url(stored_png):
+    expected = [{'type': 'image', 'url': MEDIA_URL_PREFIX + stored_png}]
+    assert resolve_post_media([{'id': stored_png}]) == expected
+    assert resolve_post_media([{'type': 'video', 'url': MEDIA_URL_PREFIX + stored_png}]) == expected
+
+
+@pytest.mark.parametrize('items', [
+    [{'id': 123}],
+    [{'id': None, 'url': 'javascript:alert(1)', 'type': 'image'}],
+    [{'type': 'image', 'url': 'javascript:alert(1)'}],
+    [{'type': 'image', 'url': 'https://example.com/cat.png'}],
+    [{'type': 'image', 'url': '/media/../bridgegen.db'}],
+    [{'type': 'image', 'url': 'data:image/png;base64,AAAA'}],
+    [{'id': 'f' * 64 + '.png'}],
+    [{'type': 'image'}],
+    ['/media/x.png'],
+    {'id': 'x'},
+])
+def test_anything_but_stored_media_is_rejected(stored_png, items):
+    with pytest.raises(ValueError):
+        resolve_post_media(items)
+
+
+@pytest.mark.parametrize('item', [{'id': 123}, {'type': 'image', 'url': 'javascript:alert(1)'}])
+def test_create_and_update_post_reject_invalid_media(client, stored_png, item):
+    assert client.post('/api/posts', json={**POST, 'media': [item]}).status_code == 400
+    assert client.put('/api/posts/post-1', json={'text': 'edit', 'media': [item]}).status_code == 400
+
+
+def test_create_post_with_uploaded_media(client, stored_png):
+    response = client.post('/api/posts', json={**POST, 'media': [{'id': stored_png}]})
+    assert response.status_code == 201
+    assert response.get_json()['media'] == [{'type': 'image', 'url': MEDIA_URL_PREFIX + stored_png}]
@@ -0,0 +1,81 @@
+import sqlite3
+import time
+
+from notifications import NotificationHub
+
+
+def test_stream_ends_after_its_lifetime():
+    hub = NotificationHub(lifetime=0.2)
+    start = time.monotonic()
+    messages = list(hub.stream('user-1'))
+    assert messages[0].startswith('retry:')
+    assert time.monotonic() - start < 5
+    assert not hub.has_subscribers('user-1')
+
+
+def test_stream_delivers_published_events():
+    hub = NotificationHub(lifetime=0.2)
+    stream = hub.stream('user-1')
+    next(stream)
+    hub.publish('user-1', 'unread', {'unreadCount': 3})
+    assert next(stream) == 'event: unread\ndata: {"unreadCount": 3}\n\n'
+    stream.close()
+    assert not hub.has_subscribers('user-1')
+
+
+def test_dispatcher_retry_does_not_duplicate_earlier_events(db, monkeypatch):
+    import database
+    import notifications
+
+    insert_notification = notifications.insert_notification
+    calls = []
+
+    def flaky_insert(cursor, event):
+        calls.append(event)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError('database is locked')
+        return insert_notification(cursor, event)
+
+    monkeypatch.setattr(notifications, 'insert_notification', flaky_insert)
+    monkeypatch.setattr(notifications.time, 'sleep', lambda seconds: None)
+    batch = [(time.monotonic(), {'type': 'comment', 'actor_id': 'user-2', 'actor_name': 'Auntie Helen',
+                                 'post_id': 'post-1', 'comment_id': comment_id})
+             for comment_id in ('c-retry-1', 'c-retry-2')]
+    rows = notifications.NotificationDispatcher()._write(batch)
+    assert len(rows) == 2
+
+    conn = database.get_db()
+    try:
+        counts = dict(conn.execute("""
+            SELECT comment_id, COUNT(*) FROM notifications
+            WHERE comment_id LIKE 'c-retry-%' GROUP BY comment_id
+        """).fetchall())
+    finally:
+        conn.close()
+    assert counts == {'c-retry-1': 1, 'c-retry-2': 1}
+
+
+def test_tail_publishes_notifications_written_by_any_worker(conn):
+    import notifications
+
+    hub = NotificationHub()
+    tail = notifications.NotificationTail(hub)
+    tail.poll(conn.cursor())
+    owner = conn.execute("SELECT user_id FROM posts WHERE id = 'post-1'").fetchone()[0]
+    q = hub.subscribe(owner)
+
+    # Written on a connection of its own, as another worker would.
+    notifications.NotificationDispatcher()._write([(time.monotonic(), {
+        'type': 'comment', 'actor_id': 'user-2', 'actor_name': 'Auntie Helen',
+        'post_id': 'post-1', 'comment_id': 'c-tail'
+    })])
+    assert tail.poll(conn.cursor()) == 1
+    event, data = q.get_nowait().split('\n')[:2]
+    assert event == 'event: notification'
+    assert '"commentId": "c-tail"' in data
+
+    notifications.mark_all_read(conn.cursor(), owner)
+    conn.commit()
+    assert tail.poll(conn.cursor()) == 1
+    assert q.get_nowait() == 'event: unread\ndata: {"unreadCount": 0}\n\n'
+    assert q.empty()
@@ -0,0 +1,58 @@
+import feed
+import mutations
+from counters import fold_counters, read_counter
+
+
+def option_votes(summary, option_id):
+    return next(opt['votes'] for opt in summary['options'] if opt['id'] == option_id)
+
+
+def test_vote_is_counted_once_when_tally_was_loaded_after_commit(conn):
+    moves, _ = mutations.run_in_transaction(conn, mutations._cast_poll_vote, 'poll-1', 'opt-1a', 'user-7')
+    # Another request reloads the poll between the commit and the tally
+    # update, so its entry already includes the vote.
+    feed.poll_tally.load(conn.cursor(), ['poll-1'])
+
+    summary = feed.poll_tally.apply_vote(conn.cursor(), 'poll-1', moves)
+    assert option_votes(summary, 'opt-1a') == read_counter(conn, 'poll_votes', 'opt-1a')
+
+
+def test_vote_is_applied_without_a_read_when_tally_was_loaded_before_commit(conn):
+    feed.poll_tally.load(conn.cursor(), ['poll-1'])
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        poll, _ = mutations.cast_poll_vote(conn, 'poll-1', 'opt-1b', 'user-7')
+    finally:
+        conn.set_trace_callback(None)
+    assert not [sql for sql in statements if 'poll_options' in sql]
+    assert option_votes(poll, 'opt-1b') == read_counter(conn, 'poll_votes', 'opt-1b')
+
+
+def test_watermark_survives_folding(conn):
+    mutations.run_in_transaction(conn, mutations._cast_poll_vote, 'poll-1', 'opt-1a', 'user-7')
+    fold_counters()
+    feed.poll_tally.load(conn.cursor(), ['poll-1'])
+    moves, _ = mutations.run_in_transaction(conn, mutations._cast_poll_vote, 'poll-1', 'opt-1b', 'user-7')
+    summary = feed.poll_tally.apply_vote(conn.cursor(), 'poll-1', moves)
+    assert option_votes(summary, 'opt-1a') == read_counter(conn, 'poll_votes', 'opt-1a')
+    assert option_votes(summary, 'opt-1b') == read_counter(conn, 'poll_votes', 'opt-1b')
+
+
+def test_older_load_does_not_replace_newer_entry():
+    tally = feed.PollTally()
+    tally._store('poll-x', [{'id': 'a', 'text': 'a', 'votes_count': 5}], watermark=20, loaded_at=1)
+    tally._store('poll-x', [{'id': 'a', 'text': 'a', 'votes_count': 4}], watermark=10, loaded_at=2)
+    assert option_votes(tally._polls['poll-x']['summary'], 'a') == 5
+
+
+def test_applied_votes_carry_over_to_loads_that_missed_them():
+    tally = feed.PollTally()
+    tally._store('poll-x', [{'id': 'a', 'text': 'a', 'votes_count': 4}], watermark=10, loaded_at=1)
+    tally.apply_vote(None, 'poll-x', [(12, 'a', 1)])
+    # A load that read before vote 12 committed, then one that read after.
+    tally._store('poll-x', [{'id': 'a', 'text': 'a', 'votes_count': 4}], watermark=11, loaded_at=2)
+    assert option_votes(tally._polls['poll-x']['summary'], 'a') == 5
+    tally._store('poll-x', [{'id': 'a', 'text': 'a', 'votes_count': 5}], watermark=12, loaded_at=3)
+    assert option_votes(tally._polls['poll-x']['summary'], 'a') == 5
+    assert tally._polls['poll-x']['applied'] == []
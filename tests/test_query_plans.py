@@ -0,0 +1,87 @@
+import re
+import sqlite3
+
+import database
+import feed
+import routes
+import thumbnails
+
+# Tables small enough, and read whole often enough, that a scan is expected.
+SCANNABLE_TABLES = {'word_of_day', 'schema_version', 'sqlite_sequence'}
+PLANNED_STATEMENT = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+TABLE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+SUBQUERY = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (\w+)')
+
+
+def exercise_routes(client):
+    posts = client.get('/api/posts?limit=5').get_json()
+    client.get(f"/api/posts?limit=5&cursor={posts['nextCursor']}")
+    client.get('/api/posts?wordId=1&limit=5')
+    results = client.get('/api/posts/search?q=chicken&limit=1').get_json()
+    client.get(f"/api/posts/search?q=chicken&limit=1&cursor={results['nextCursor']}")
+    client.get('/api/search/suggest?q=ch')
+
+    created = client.post('/api/posts', json={
+        'userId': 'user-1', 'author': 'Joel Lim', 'initials': 'JL', 'age': 19, 'type': 'youth',
+        'wordId': 1, 'text': 'query plans', 'poll': {'question': 'Which?', 'options': ['a', 'b']}
+    }).get_json()
+    client.put(f"/api/posts/{created['id']}", json={'text': 'query plans, edited'})
+
+    client.post('/api/posts/post-1/like', json={'userId': 'user-2'})
+    for _ in range(2):
+        client.post('/api/posts/post-1/like', json={'userId': 'user-2'}, headers={'Idempotency-Key': 'plan'})
+    comment = client.post('/api/posts/post-1/comments', json={
+        'userId': 'user-2', 'author': 'Auntie Helen', 'initials': 'AH', 'type': 'senior', 'text': 'hello'
+    }).get_json()
+    client.put(f"/api/posts/post-1/comments/{comment['id']}", json={'text': 'hello again'})
+    client.post('/api/posts/post-1/comments/c1/like', json={'userId': 'user-2'})
+    client.post('/api/polls/poll-1/vote', json={'userId': 'user-2', 'optionId': 'opt-1a'})
+    client.post('/api/interactions/batch', json={'userId': 'user-3', 'operations': [
+        {'key': 'k1', 'op': 'like', 'postId': 'post-2'},
+        {'key': 'k2', 'op': 'likeComment', 'postId': 'post-1', 'commentId': 'c1'},
+        {'key': 'k3', 'op': 'vote', 'pollId': 'poll-1', 'optionId': 'opt-1b'},
+        {'key': 'k4', 'op': 'comment', 'postId': 'post-1', 'author': 'Maya Ng', 'initials': 'MN',
+         'type': 'youth', 'text': 'batched'}
+    ]})
+
+    notifications = client.get('/api/notifications?userId=user-1').get_json()['notifications']
+    if notifications:
+        client.post(f"/api/notifications/{notifications[0]['id']}/read")
+    client.post('/api/notifications/read-all', json={'userId': 'user-1'})
+    client.post('/api/notifications/clear-all', json={'userId': 'user-1'})
+    client.delete(f"/api/posts/post-1/comments/{comment['id']}")
+    client.delete(f"/api/posts/{created['id']}")
+
+
+def test_route_queries_use_indexes(client, monkeypatch):
+    statements = []
+    open_connection = database.open_connection
+
+    def traced_connection(*args, **kwargs):
+        conn = open_connection(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(database, 'open_connection', traced_connection)
+    # A cache that keeps nothing, so every page runs its hydration queries.
+    uncached = feed.FeedCache(max_entries=0)
+    for module in (feed, routes, thumbnails):
+        monkeypatch.setattr(module, 'feed_cache', uncached)
+    exercise_routes(client)
+    statements = [sql for sql in statements if PLANNED_STATEMENT.match(sql)]
+    assert statements
+
+    conn = sqlite3.connect(database.DB_PATH)
+    scans = []
+    try:
+        for sql in dict.fromkeys(statements):
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            # A subquery in FROM shows up as a scan of its own result.
+            subqueries = {match.group(1) for match in map(SUBQUERY.match, plan) if match}
+            for detail in plan:
+                match = TABLE_SCAN.match(detail)
+                if match and match.group(1) not in SCANNABLE_TABLES | subqueries:
+                    scans.append((detail, ' '.join(sql.split())))
+    finally:
+        conn.close()
+    assert not scans, '\n'.join(f'{detail}: {sql}' for detail, sql in scans)
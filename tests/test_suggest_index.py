@@ -0,0 +1,51 @@
+import routes
+import search
+from search import PrefixIndex
+
+
+def texts(index, prefix):
+    return [suggestion['text'] for suggestion in index.suggest(prefix)]
+
+
+def test_removed_terms_are_no_longer_suggested():
+    index = PrefixIndex()
+    index.add_post('kopitiam kopi', 'Joel Lim')
+    index.remove_post('kopitiam kopi', 'Joel Lim')
+    assert texts(index, 'kop') == []
+    assert texts(index, 'joel') == []
+    assert len(index) == 0
+
+
+def test_removal_lets_lower_terms_back_into_the_top_list():
+    index = PrefixIndex(max_suggestions=2)
+    for term, count in (('kaya', 3), ('kampung', 2), ('kopi', 1)):
+        index.add(term, weight=count)
+    assert texts(index, 'k') == ['kaya', 'kampung']
+
+    index.remove('kaya', weight=2)
+    index.remove('kampung', weight=2)
+    assert texts(index, 'k') == ['kaya', 'kopi']
+
+
+def test_vocabulary_words_outlive_their_posts():
+    index = PrefixIndex()
+    index.add('Shiok', 'word')
+    index.add_post('so shiok')
+    index.remove_post('so shiok')
+    assert texts(index, 'shi') == ['Shiok']
+
+
+def test_edits_and_deletes_update_suggestions(client, conn, monkeypatch):
+    monkeypatch.setattr(routes, 'suggest_index', search.build_suggest_index(conn))
+    created = client.post('/api/posts', json={
+        'userId': 'user-1', 'author': 'Joel Lim', 'initials': 'JL', 'age': 19, 'type': 'youth',
+        'wordId': 1, 'text': 'zanzibar holiday'
+    }).get_json()
+    assert texts(routes.suggest_index, 'zanz') == ['zanzibar']
+
+    client.put(f"/api/posts/{created['id']}", json={'text': 'zucchini bread'})
+    assert texts(routes.suggest_index, 'zanz') == []
+    assert texts(routes.suggest_index, 'zucc') == ['zucchini']
+
+    client.delete(f"/api/posts/{created['id']}")
+    assert texts(routes.suggest_index, 'zucc') == []
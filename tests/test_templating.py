@@ -0,0 +1,42 @@
+import os
+import stat
+
+import pytest
+
+from templating import template_bytecode_cache
+
+
+def test_default_cache_uses_jinja_private_directory():
+    cache = template_bytecode_cache()
+    info = os.lstat(cache.directory)
+    assert info.st_uid == os.getuid()
+    assert stat.S_IMODE(info.st_mode) == stat.S_IRWXU
+
+
+def test_configured_directory_is_created_private(tmp_path):
+    directory = tmp_path / 'jinja'
+    cache = template_bytecode_cache(str(directory))
+    assert cache.directory == str(directory)
+    assert stat.S_IMODE(os.lstat(directory).st_mode) == stat.S_IRWXU
+
+
+def test_open_directory_is_tightened(tmp_path):
+    directory = tmp_path / 'jinja'
+    directory.mkdir()
+    directory.chmod(0o777)
+    assert template_bytecode_cache(str(directory)) is not None
+    assert stat.S_IMODE(os.lstat(directory).st_mode) == stat.S_IRWXU
+
+
+def test_symlinked_directory_is_refused(tmp_path):
+    (tmp_path / 'elsewhere').mkdir()
+    (tmp_path / 'jinja').symlink_to(tmp_path / 'elsewhere')
+    assert template_bytecode_cache(str(tmp_path / 'jinja')) is None
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason='changing ownership needs root')
+def test_directory_owned_by_another_user_is_refused(tmp_path):
+    directory = tmp_path / 'jinja'
+    directory.mkdir(mode=0o700)
+    os.chown(directory, os.getuid() + 1000, -1)
+    assert template_bytecode_cache(str(directory)) is None
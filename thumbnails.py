@@ -0,0 +1,208 @@
+import io
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from database import get_db
+from feed import feed_cache
+from media import MEDIA_URL_PREFIX, media_path, store_media_bytes
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+MEDIA_WORKERS = int(os.environ.get('BRIDGEGEN_MEDIA_WORKERS', 2))
+VARIANT_WIDTHS = (320, 640, 1080)
+POSTER_WIDTH = 640
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+FFMPEG = shutil.which('ffmpeg')
+
+# Feed media are shown at phone width, so each uploaded image is also
+# rendered at a few smaller widths, as WebP and as JPEG/PNG, and each video
+# gets a poster frame. The renders run in a process pool so they neither
+# block request threads nor compete with them for the GIL. Until a job has
+# finished the feed simply has no variants and falls back to the original.
+
+
+def _save_image(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def render_image_variants(path):
+    # Runs in a pool worker. Returns [(kind, width, format, url)].
+    with Image.open(path) as source:
+        if getattr(source, 'is_animated', False):
+            return []
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+    variants = []
+    for width in widths:
+        resized = image if width == image.width else image.resize(
+            (width, max(1, round(image.height * width / image.width))), Image.LANCZOS
+        )
+        webp = _save_image(resized, 'WEBP', quality=WEBP_QUALITY, method=4)
+        variants.append(('image', width, 'webp', store_media_bytes(webp, 'image/webp')))
+        if has_alpha:
+            fallback = _save_image(resized, 'PNG', optimize=True)
+            variants.append(('image', width, 'png', store_media_bytes(fallback, 'image/png')))
+        else:
+            fallback = _save_image(resized, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            variants.append(('image', width, 'jpeg', store_media_bytes(fallback, 'image/jpeg')))
+    return variants
+
+
+def render_video_poster(path):
+    # Runs in a pool worker. Takes the frame one second in, or the first
+    # frame for clips shorter than that.
+    for offset in ('1', '0'):
+        result = subprocess.run(
+            [FFMPEG, '-v', 'error', '-ss', offset, '-i', path, '-frames:v', '1',
+             '-vf', f"scale='min({POSTER_WIDTH},iw)':-2", '-f', 'image2', '-c:v', 'mjpeg', 'pipe:1'],
+            capture_output=True, timeout=60
+        )
+        if result.returncode == 0 and result.stdout:
+            return [('poster', POSTER_WIDTH, 'jpeg', store_media_bytes(result.stdout, 'image/jpeg'))]
+    return []
+
+
+def render_variants(path, media_type):
+    if media_type == 'video':
+        return render_video_poster(path) if FFMPEG else []
+    return render_image_variants(path) if Image else []
+
+
+def pipeline_available():
+    return Image is not None or FFMPEG is not None
+
+
+class MediaPipeline:
+    # Queues render jobs for stored media and records the results in
+    # media_variants. Variants are keyed by the source URL, which is a
+    # content hash, so a file shared by several posts is rendered once.
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is not None or not pipeline_available() or self.workers <= 0:
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Fork the workers now, while the process is still single-threaded,
+        # rather than on the first upload when the background tasks are
+        # already running.
+        for future in [self._executor.submit(pipeline_available) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, media_type, source_url):
+        if self._executor is None or not source_url.startswith(MEDIA_URL_PREFIX):
+            return False
+        if (media_type == 'video' and not FFMPEG) or (media_type == 'image' and Image is None):
+            return False
+        path = media_path(source_url[len(MEDIA_URL_PREFIX):])
+        if not path:
+            return False
+        with self._lock:
+            if source_url in self._pending:
+                return False
+            self._pending.add(source_url)
+            self.submitted += 1
+        future = self._executor.submit(render_variants, path, media_type)
+        future.add_done_callback(lambda done: self._finish(source_url, done))
+        return True
+
+    def _finish(self, source_url, future):
+        try:
+            variants = future.result()
+            if variants:
+                record_variants(source_url, variants)
+                feed_cache.invalidate()
+            with self._lock:
+                self.completed += 1
+        except Exception as err:
+            print(f"Error rendering variants for {source_url}: {err}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._pending.discard(source_url)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'workers': self.workers if self.running else 0,
+                'pending': len(self._pending),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+
+media_pipeline = MediaPipeline(MEDIA_WORKERS)
+
+
+def record_variants(source_url, variants):
+    conn = get_db()
+    if not conn:
+        return
+    try:
+        conn.executemany("""
+            INSERT INTO media_variants (source_url, kind, width, format, url) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (source_url, kind, width, format) DO UPDATE SET url = excluded.url
+        """, [(source_url, *variant) for variant in variants])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def queue_media_variants(media_items):
+    for item in media_items:
+        media_pipeline.submit(item['type'], item['url'])
+
+
+def queue_missing_variants():
+    # Requeues stored media that has no variants yet, e.g. jobs that were
+    # still pending when the previous process exited.
+    if not media_pipeline.running:
+        return
+    conn = get_db()
+    if not conn:
+        return
+    try:
+        rows = conn.execute(f"""
+            SELECT DISTINCT m.media_type, m.url FROM post_media m
+            WHERE substr(m.url, 1, {len(MEDIA_URL_PREFIX)}) = ?
+              AND NOT EXISTS (SELECT 1 FROM media_variants v WHERE v.source_url = m.url)
+        """, (MEDIA_URL_PREFIX,)).fetchall()
+    except sqlite3.Error as err:
+        print(f"Error finding media without variants: {err}")
+        return
+    finally:
+        conn.close()
+    for media_type, url in rows:
+        media_pipeline.submit(media_type, url)
+
+
+def start_media_pipeline():
+    media_pipeline.start()
+    queue_missing_variants()
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from database import get_db
+
+WORD_CACHE_CHECK_INTERVAL = float(os.environ.get('BRIDGEGEN_WORD_CACHE_CHECK_INTERVAL', 60))
+
+DEFAULT_WORD = {
+    'id': 1,
+    'word': 'Ang Mo',
+    'phonetic': '[ ahng moh ]',
+    'description': 'A colloquial Hokkien term used in Singapore.',
+    'challenge': 'Share your thoughts about this word!',
+    'date': '2025-01-28'
+}
+
+
+def _seconds_until_midnight(now):
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds()
+
+
+class WordCache:
+    # Holds the whole word_of_day table, which changes at most once a day,
+    # so the feed pages can pick their word without touching the database.
+    # The word of the day is the newest word dated today or earlier and is
+    # recomputed at local midnight, so a word scheduled ahead of time goes
+    # live without a reload. Words inserted by another worker are picked up
+    # by a cheap MAX(id)/COUNT(*) check at most once per check interval;
+    # invalidate() drops the cache at once for writes made in this process.
+
+    def __init__(self, check_interval=60):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._words = None
+        self._by_id = {}
+        self._signature = None
+        self._latest = None
+        self._day = None
+        self._checked_at = 0
+        self.version = 0
+        self.loads = 0
+        self.checks = 0
+        self.rollovers = 0
+
+    def _load(self, conn):
+        rows = conn.execute("""
+            SELECT id, word, phonetic, description, challenge, date
+            FROM word_of_day
+            ORDER BY date DESC
+        """).fetchall()
+        self._words = [{
+            'id': row[0],
+            'word': row[1],
+            'phonetic': row[2],
+            'description': row[3],
+            'challenge': row[4],
+            'date': row[5]
+        } for row in rows]
+        self._by_id = {word['id']: word for word in self._words}
+        self._signature = self._read_signature(conn)
+        self._day = None
+        self.version += 1
+        self.loads += 1
+
+    def _read_signature(self, conn):
+        return tuple(conn.execute("SELECT MAX(id), COUNT(*) FROM word_of_day").fetchone())
+
+    def _refresh(self):
+        # Called with the lock held.
+        now = time.monotonic()
+        if self._words is not None and now - self._checked_at < self.check_interval:
+            return
+        conn = get_db()
+        if not conn:
+            return
+        try:
+            if self._words is None:
+                self._load(conn)
+            else:
+                self.checks += 1
+                if self._read_signature(conn) != self._signature:
+                    self._load(conn)
+            self._checked_at = now
+        except sqlite3.Error as err:
+            print(f"Error loading words: {err}")
+        finally:
+            conn.close()
+
+    def _roll_over(self):
+        # Called with the lock held. Dates are ISO strings, so they compare
+        # in calendar order.
+        today = date.today()
+        if self._day == today:
+            return
+        if self._day is not None:
+            self.rollovers += 1
+        self._day = today
+        cutoff = today.isoformat()
+        current = [word for word in self._words if str(word['date'] or '')[:10] <= cutoff]
+        self._latest = (current or self._words or [None])[0]
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._words or [])
+
+    def snapshot(self):
+        # (version, words) read together; version changes whenever the word
+        # list is reloaded, so it can key anything rendered from the list.
+        with self._lock:
+            self._refresh()
+            return self.version, list(self._words or [])
+
+    def get(self, word_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(word_id)
+
+    def latest(self):
+        with self._lock:
+            self._refresh()
+            if self._words is None:
+                return DEFAULT_WORD
+            self._roll_over()
+            return self._latest or DEFAULT_WORD
+
+    def invalidate(self):
+        with self._lock:
+            self._words = None
+            self._by_id = {}
+            self._day = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self._words is not None,
+                'words': len(self._words or []),
+                'version': self.version,
+                'latestId': self._latest['id'] if self._latest else None,
+                'secondsToRollover': round(_seconds_until_midnight(datetime.now())),
+                'loads': self.loads,
+                'checks': self.checks,
+                'rollovers': self.rollovers
+            }
+
+
+word_cache = WordCache(WORD_CACHE_CHECK_INTERVAL)
+
+
+def resolve_word(word_id=None):
+    # The word a feed page is showing: the requested one if it exists,
+    # otherwise the word of the day.
+    if word_id:
+        word = word_cache.get(word_id)
+        if word:
+            return word
+    return word_cache.latest()
+
+
+def load_word_cache():
+    word_cache.all()